@@ -3,10 +3,12 @@ from django.contrib.auth.admin import UserAdmin
 from .forms import CustomUserCreationForm, CustomUserChangeForm
 from .models import *
 import nested_admin
+from . import search
 
 
 class ErrorAdmin(nested_admin.NestedTabularInline):
     model = ErrorStatistics
+    raw_id_fields = ("task", "answer")
 
 
 @admin.register(Statistics)
@@ -53,6 +55,7 @@ class AnswerAdmin(nested_admin.NestedTabularInline):
 class TaskAdmin(nested_admin.NestedTabularInline):
     model = Task
     inlines = [AnswerAdmin, ]
+    readonly_fields = ("correct_count", )
 
 
 @admin.register(Exam)
@@ -62,3 +65,15 @@ class ExamAdmin(nested_admin.NestedModelAdmin):
     search_fields = ("title",)
     ordering = ("publish_time",)
     inlines = [TaskAdmin, CommentAdmin, ]
+    readonly_fields = ("task_count", "max_scores")
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.filter(pk__in=search.search(search_term, limit=None, shown_only=False)), False
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        exam = form.instance
+        exam.tasks.refresh_correct_count()
+        exam.refresh_summary()
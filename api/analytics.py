@@ -0,0 +1,71 @@
+"""
+Статистика выполнения контрольных, вычисляемая агрегатами в базе.
+"""
+from django.db.models import Avg, Count, Max, Min
+
+from .models import ErrorStatistics, Statistics, Task
+
+PERCENTILES = (25, 50, 75, 90)
+
+
+def _percentile(grades, count, percent):
+    """
+    Перцентиль с линейной интерполяцией. grades - упорядоченный queryset оценок,
+    из него читаются не более двух соседних значений (индекс exam, is_graded, grade).
+    """
+    position = (count - 1) * percent / 100
+    lower = int(position)
+    values = list(grades[lower:lower + 2])
+    if len(values) == 1 or position == lower:
+        return float(values[0])
+    return values[0] + (values[1] - values[0]) * (position - lower)
+
+
+def graded_attempts(exam):
+    return Statistics.objects.filter(exam=exam, is_graded=True)
+
+
+def exam_summary(exam):
+    """
+    Сводка по оцененным попыткам контрольной: количество, средняя, медиана
+    и перцентили оценки, распределение оценок и доля ошибок по вопросам.
+    Незавершенные попытки (grade=0, is_graded=False) не учитываются.
+    """
+    statistics = graded_attempts(exam).order_by()
+    summary = statistics.aggregate(attempts=Count("pk"), mean=Avg("grade"), min=Min("grade"), max=Max("grade"))
+    attempts = summary["attempts"]
+    grades = statistics.order_by("grade").values_list("grade", flat=True)
+    percentiles = {str(percent): _percentile(grades, attempts, percent) if attempts else None
+                   for percent in PERCENTILES}
+    histogram = list(statistics.values("grade").annotate(count=Count("pk")).order_by("grade"))
+    return dict(
+        summary,
+        max_scores=exam.max_scores,
+        median=percentiles["50"],
+        percentiles=percentiles,
+        histogram=histogram,
+        questions=question_errors(exam, attempts),
+    )
+
+
+def question_errors(exam, attempts, limit=None):
+    """
+    Количество и доля ошибок по заданиям в оцененных попытках, от самых трудных.
+    attempts - количество оцененных попыток. Ошибки группируются по task_id (индекс внешнего ключа), тексты вопросов
+    читаются отдельным запросом только для попавших в результат заданий.
+    Старые ошибки без задания группируются по тексту вопроса.
+    """
+    if not attempts:
+        return []
+    rows = [(count, task_id, None) for task_id, count in
+            ErrorStatistics.objects.filter(task__exam=exam, statistics__is_graded=True).values("task").annotate(count=Count("pk"))
+            .order_by().values_list("task", "count")]
+    rows += [(count, None, question) for question, count in
+             ErrorStatistics.objects.filter(statistics__exam=exam, statistics__is_graded=True, task__isnull=True)
+             .values("question").annotate(count=Count("pk")).order_by().values_list("question", "count")]
+    rows.sort(key=lambda row: (-row[0], row[1] is None, row[1] or 0, row[2] or ""))
+    rows = rows[:limit]
+    questions = dict(Task.objects.filter(pk__in=[task_id for _, task_id, _ in rows if task_id])
+                     .values_list("pk", "question"))
+    return [{"task": task_id, "question": questions[task_id] if task_id else question,
+             "errors": count, "rate": count / attempts} for count, task_id, question in rows]
@@ -0,0 +1,115 @@
+"""
+Аутентификация без хэширования пароля и запроса к базе на каждый запрос.
+
+BasicAuthentication вызывает PBKDF2 на каждый запрос. CachedBasicAuthentication
+после успешной проверки запоминает на BASIC_AUTH_CACHE_TIMEOUT секунд id
+пользователя и отпечаток хэша его пароля под ключом HMAC(SECRET_KEY, email и пароль):
+повторный запрос с теми же данными стоит одного чтения кэша и выборки
+пользователя по id. Смена пароля или email делает запись неподходящей.
+
+CachedTokenAuthentication хранит поля пользователя токена, кроме пароля, в кэше
+на TOKEN_AUTH_CACHE_TIMEOUT секунд, и запрос с известным токеном не обращается
+к базе. Запись удаляется после фиксации транзакции, удалившей токен (token/logout)
+или изменившей пользователя: is_active и другие поля. Изменения через
+QuerySet.update сигналов не вызывают и видны только по истечении
+TOKEN_AUTH_CACHE_TIMEOUT, поэтому он небольшой.
+"""
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import cache
+from .models import CustomUser
+
+BASIC_NAMESPACE = "auth-basic"
+TOKEN_NAMESPACE = "auth-token"
+# Поля, изменение которых не делает устаревшим пользователя в кэше токенов
+UNCACHED_USER_FIELDS = {"last_login", "updated_at"}
+# Поля, которые не попадают в кэш токенов
+SECRET_USER_FIELDS = {"password"}
+
+
+def _digest(*parts):
+    message = "\0".join(str(part) for part in parts).encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def credentials_key(userid, password):
+    return _digest("basic", userid, password)
+
+
+def token_key(key):
+    return _digest("token", key)
+
+
+def user_stamp(user):
+    """Отпечаток данных входа пользователя, меняется при смене email или пароля"""
+    return _digest(user.get_username(), user.password)
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+
+    def authenticate_credentials(self, userid, password, request=None):
+        key = credentials_key(userid, password)
+        cached = cache.get(BASIC_NAMESPACE, key)
+        if cached is not None:
+            user_id, stamp = cached
+            user = get_user_model()._default_manager.filter(pk=user_id).first()
+            if user is not None and user.is_active and hmac.compare_digest(user_stamp(user), stamp):
+                return user, None
+        user, auth = super().authenticate_credentials(userid, password, request)
+        cache.put(BASIC_NAMESPACE, key, value=(user.pk, user_stamp(user)),
+                  timeout=getattr(settings, "BASIC_AUTH_CACHE_TIMEOUT", 60))
+        return user, auth
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cached = cache.get(TOKEN_NAMESPACE, token_key(key))
+        if cached is not None:
+            db, values = cached
+            # Пароль остается отложенным полем и при обращении читается из базы
+            user = get_user_model().from_db(db, list(values), list(values.values()))
+            return user, self.get_model()(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        values = {field.attname: getattr(user, field.attname) for field in user._meta.concrete_fields
+                  if field.name not in SECRET_USER_FIELDS}
+        cache.put(TOKEN_NAMESPACE, token_key(key), value=(user._state.db, values),
+                  timeout=getattr(settings, "TOKEN_AUTH_CACHE_TIMEOUT", 60))
+        return user, token
+
+
+def invalidate_tokens(keys):
+    for key in keys:
+        cache.delete(TOKEN_NAMESPACE, token_key(key))
+
+
+def invalidate_tokens_on_commit(keys):
+    """
+    Удаляет записи после фиксации транзакции: иначе параллельный запрос
+    может до фиксации прочитать старые данные и снова положить их в кэш
+    """
+    keys = list(keys)
+    transaction.on_commit(lambda: invalidate_tokens(keys))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens_on_commit([instance.key])
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    fields = update_fields or [field.name for field in instance._meta.concrete_fields]
+    if any(instance.field_changed(name) for name in fields if name not in UNCACHED_USER_FIELDS):
+        invalidate_tokens_on_commit(Token.objects.filter(user=instance).values_list("key", flat=True))
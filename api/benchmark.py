@@ -0,0 +1,283 @@
+"""
+Замеры времени ответа и количества SQL-запросов для всех маршрутов router из api/urls.py.
+
+Маршруты и методы берутся из router.registry, объекты для detail-маршрутов -
+из текущей базы (см. api.seed): контрольная с наибольшим количеством попыток,
+ее автор, ученик с попыткой и т. д. Запросы идут через тестовый клиент со всеми
+middleware и авторизацией по токену. Изменяющие запросы выполняются в
+транзакции, которая откатывается, тела для них строит PAYLOADS.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+from collections import namedtuple
+from types import SimpleNamespace
+
+import django
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import catalogue, grading, serializers, transfer
+from .models import Answer, Comment, CustomUser, Exam, Profile, Statistics, Task
+from .urls import router
+
+FORMAT_VERSION = 1
+READ_METHODS = ("get", "head", "options")
+
+Endpoint = namedtuple("Endpoint", "name method url role payload content_type")
+
+
+def _exam_payload(fixtures):
+    return serializers.ExamSerializer(fixtures.exam).data
+
+
+def _new_exam_payload(fixtures):
+    data = _exam_payload(fixtures)
+    data.pop("id", None)
+    for task in data["tasks"]:
+        task.pop("id", None)
+        for answer in task["answers"]:
+            answer.pop("id", None)
+    return data
+
+
+def _submit_payload(fixtures):
+    key = grading.load_answer_key(fixtures.exam.pk)
+    return {"answers": [{"task": task.id, "answers": sorted(task.correct)} for task in key]}
+
+
+def _import_payload(fixtures):
+    return "".join(transfer.export_exams(Exam.objects.filter(pk=fixtures.exam.pk))).encode()
+
+
+# Тела изменяющих запросов по "ViewSet.action", маршруты без тела пропускаются.
+# ProfileViewSet требует аватарку, файл которой остался бы в media после отката
+PAYLOADS = {
+    "ExamWithTaskViewSet.create": _new_exam_payload,
+    "ExamWithTaskViewSet.update": _exam_payload,
+    "ExamWithTaskViewSet.partial_update": lambda fixtures: {"title": fixtures.exam.title},
+    "ExamWithTaskViewSet.import_exams": _import_payload,
+    "StatisticsViewSet.create": lambda fixtures: {"exam": fixtures.exam.pk, "grade": 0, "total": 0},
+    "StatisticsViewSet.update": lambda fixtures: {"exam": fixtures.exam.pk, "grade": fixtures.attempt.grade,
+                                                  "total": fixtures.attempt.total, "errors": []},
+    "StatisticsViewSet.partial_update": lambda fixtures: {"grade": fixtures.attempt.grade, "errors": []},
+    "StatisticsViewSet.submit": _submit_payload,
+    "CommentViewSet.create": lambda fixtures: {"exam": fixtures.exam.pk, "text": "Комментарий"},
+    "CommentViewSet.update": lambda fixtures: {"exam": fixtures.exam.pk, "text": "Комментарий"},
+    "CommentViewSet.partial_update": lambda fixtures: {"text": "Комментарий"},
+    "TaskViewSet.destroy": None,
+    "AnswerViewSet.destroy": None,
+    "ExamWithTaskViewSet.destroy": None,
+    "CommentViewSet.destroy": None,
+}
+CONTENT_TYPES = {
+    "ExamWithTaskViewSet.import_exams": "application/x-ndjson",
+}
+QUERY_PARAMS = {
+    "ExamViewSet.search": lambda fixtures: {"q": fixtures.exam.title.split()[0]},
+}
+# Объекты, владельцем которых является ученик, а не учитель
+STUDENT_MODELS = (Statistics, Comment)
+
+
+class NoData(Exception):
+    pass
+
+
+def get_fixtures():
+    """
+    Объекты для detail-маршрутов: самая популярная контрольная, ее автор,
+    ученик с попыткой (по возможности оставлявший комментарии) и его объекты.
+    """
+    exam = (Exam.objects.filter(is_show=True).annotate(attempts=Count("statistics"))
+            .order_by("-attempts", "pk").select_related("author").first())
+    if exam is None or not exam.attempts:
+        raise NoData("В базе нет контрольных с попытками, заполните ее командой seed_perf_data")
+    attempts = exam.statistics.select_related("user").order_by("pk")
+    attempt = attempts.filter(user__comments__isnull=False).first() or attempts.first()
+    task = exam.tasks.order_by("pk").first()
+    return SimpleNamespace(
+        exam=exam, teacher=exam.author, student=attempt.user, attempt=attempt,
+        objects={
+            Exam: exam,
+            Statistics: attempt,
+            Comment: Comment.objects.filter(author=attempt.user).order_by("pk").first(),
+            Task: task,
+            Answer: Answer.objects.filter(task=task).order_by("pk").first(),
+            Profile: Profile.objects.get(user=exam.author),
+        },
+    )
+
+
+def _model(viewset, action, user):
+    view = viewset(action=action, kwargs={}, format_kwarg=None,
+                   request=SimpleNamespace(user=user, query_params={}, method="GET"))
+    return view.get_queryset().model
+
+
+def get_endpoints(fixtures):
+    """Endpoint для каждого маршрута и метода router, кроме маршрутов без тела в PAYLOADS"""
+    prefix = reverse("api-root")
+    for url_prefix, viewset, _ in router.registry:
+        for route in router.get_routes(viewset):
+            mapping = router.get_method_map(viewset, route.mapping)
+            if not mapping:
+                continue
+            for method, action in mapping.items():
+                name = "{}.{}".format(viewset.__name__, action)
+                model = _model(viewset, action, fixtures.teacher)
+                url = route.url.format(prefix=url_prefix, lookup="{pk}", trailing_slash=router.trailing_slash)
+                url = prefix + url.strip("^$")
+                role = "student" if issubclass(model, STUDENT_MODELS) else "teacher"
+                if route.detail:
+                    obj = fixtures.objects.get(model)
+                    if obj is None:
+                        yield Endpoint(name, method, url, role, NotImplemented, None)
+                        continue
+                    url = url.format(pk=obj.pk)
+                if method in READ_METHODS:
+                    params = QUERY_PARAMS.get(name)
+                    yield Endpoint(name, method, url, role, params(fixtures) if params else None, None)
+                elif name in PAYLOADS:
+                    build = PAYLOADS[name]
+                    yield Endpoint(name, method, url, role, build(fixtures) if build else None,
+                                   CONTENT_TYPES.get(name))
+                else:
+                    yield Endpoint(name, method, url, role, NotImplemented, None)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(0, int(round(len(values) * percent / 100.0)) - 1)]
+
+
+def _request(client, endpoint):
+    if endpoint.content_type:
+        response = client.generic(endpoint.method.upper(), endpoint.url, endpoint.payload,
+                                  content_type=endpoint.content_type)
+    elif endpoint.method in READ_METHODS:
+        response = getattr(client, endpoint.method)(endpoint.url, endpoint.payload)
+    else:
+        response = getattr(client, endpoint.method)(endpoint.url, endpoint.payload, format="json")
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def measure(client, endpoint, repeat):
+    """Первый (холодный) запрос и repeat повторных, изменения в базе откатываются"""
+    timings = []
+    queries = []
+    for _ in range(repeat + 1):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = _request(client, endpoint)
+                timings.append((time.perf_counter() - start) * 1000)
+            transaction.set_rollback(True)
+        queries.append(len(context))
+    cold, timings = timings[0], timings[1:]
+    return {
+        "method": endpoint.method.upper(),
+        "url": endpoint.url,
+        "role": endpoint.role,
+        "status": response.status_code,
+        "cold_ms": round(cold, 3),
+        "cold_queries": queries[0],
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "queries": queries[-1],
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat=20, only=None, log=None):
+    """Замеряет все маршруты, only - подстрока имени "ViewSet.action" для выбора части маршрутов"""
+    fixtures = get_fixtures()
+    clients = {}
+    for role in ("teacher", "student"):
+        token, _ = Token.objects.get_or_create(user=getattr(fixtures, role))
+        clients[role] = APIClient()
+        clients[role].credentials(HTTP_AUTHORIZATION="Token " + token.key)
+    results = {}
+    skipped = []
+    # Ответы принимаются только для неоцененной попытки, изменения каждого замера откатываются
+    fixtures.objects[Statistics] = Statistics.objects.create(user=fixtures.student, exam=fixtures.exam,
+                                                             grade=0, total=0)
+    # Замеры повторяют запросы, ограничение частоты отправки ответов им мешает
+    throttling = override_settings(EXAM_SUBMIT_RATE=None)
+    throttling.enable()
+    try:
+        for endpoint in get_endpoints(fixtures):
+            key = "{} {}".format(endpoint.name, endpoint.method.upper())
+            if only and only not in endpoint.name:
+                continue
+            if endpoint.payload is NotImplemented:
+                skipped.append(key)
+                continue
+            results[key] = measure(clients[endpoint.role], endpoint, repeat)
+            if log:
+                log(key, results[key])
+    finally:
+        throttling.disable()
+        fixtures.objects[Statistics].delete()
+        # Откаченные изменения могли попасть в кэш
+        catalogue.invalidate()
+        grading.answer_keys.clear()
+    return {
+        "format": FORMAT_VERSION,
+        "meta": {
+            "commit": _commit(),
+            "time": timezone.now().isoformat(),
+            "repeat": repeat,
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "rows": {model.__name__: model.objects.count()
+                     for model in (CustomUser, Exam, Task, Answer, Comment, Statistics)},
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(baseline, current, threshold=20.0):
+    """
+    Строки (маршрут, p50 до, p50 после, изменение в %, запросов до, запросов после, регрессия).
+    Регрессия - больше запросов или p50 медленнее более чем на threshold процентов.
+    """
+    rows = []
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        change = (result["p50_ms"] - before["p50_ms"]) * 100.0 / before["p50_ms"] if before["p50_ms"] else 0.0
+        regression = result["queries"] > before["queries"] or change > threshold
+        rows.append((key, before["p50_ms"], result["p50_ms"], change, before["queries"], result["queries"],
+                     regression))
+    return rows
+
+
+def load(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def dump(results, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2, sort_keys=True)
@@ -0,0 +1,64 @@
+"""
+Бюджеты SQL-запросов маршрутов API.
+
+BUDGETS - наибольшее допустимое количество запросов на один запрос к маршруту
+"ViewSet.action МЕТОД" (ключи результатов api.benchmark), включая авторизацию
+по токену и промах кэша. Количество не должно зависеть от объема данных:
+check сравнивает замеры на данных разного объема и сообщает о маршрутах,
+где запросов стало больше, а также о маршрутах без бюджета.
+После намеренного изменения количества запросов бюджет правится здесь.
+"""
+
+BUDGETS = {
+    "ExamViewSet.list GET": 2,
+    "ExamViewSet.search GET": 3,
+    "ExamViewSet.retrieve GET": 4,
+    "ExamWithTaskViewSet.create POST": 13,
+    "ExamWithTaskViewSet.export GET": 5,
+    "ExamWithTaskViewSet.import_exams POST": 12,
+    "ExamWithTaskViewSet.retrieve GET": 5,
+    "ExamWithTaskViewSet.update PUT": 8,
+    "ExamWithTaskViewSet.partial_update PATCH": 6,
+    # Каскадное удаление: по запросу на связанную модель и пересчет итогов учеников
+    "ExamWithTaskViewSet.destroy DELETE": 23,
+    "ExamsMeViewSet.list GET": 2,
+    "ExamsStatisticsViewSet.retrieve GET": 4,
+    "ExamsStatisticsViewSet.attempts GET": 4,
+    "ExamsStatisticsViewSet.export GET": 3,
+    "ExamsStatisticsViewSet.hardest GET": 6,
+    "ExamsStatisticsViewSet.summary GET": 11,
+    "StatisticsViewSet.list GET": 3,
+    "StatisticsViewSet.create POST": 4,
+    "StatisticsViewSet.summary GET": 3,
+    "StatisticsViewSet.update PUT": 6,
+    "StatisticsViewSet.partial_update PATCH": 5,
+    "StatisticsViewSet.submit POST": 15,
+    "CommentViewSet.create POST": 3,
+    "CommentViewSet.update PUT": 4,
+    "CommentViewSet.partial_update PATCH": 3,
+    "CommentViewSet.destroy DELETE": 3,
+    "TaskViewSet.destroy DELETE": 16,
+    "AnswerViewSet.destroy DELETE": 7,
+}
+
+
+def check(runs, budgets=BUDGETS):
+    """
+    runs - результаты api.benchmark.run на данных возрастающего объема.
+    Возвращает список нарушений, пустой - если все маршруты в бюджете.
+    """
+    problems = []
+    previous = {}
+    for run in runs:
+        for key, result in run["results"].items():
+            queries = max(result["cold_queries"], result["queries"])
+            budget = budgets.get(key)
+            if budget is None:
+                problems.append("{}: нет бюджета, запросов {}".format(key, queries))
+            elif queries > budget:
+                problems.append("{}: {} запросов, бюджет {}".format(key, queries, budget))
+            if key in previous and queries > previous[key]:
+                problems.append("{}: запросов стало больше с ростом данных, {} -> {}".format(
+                    key, previous[key], queries))
+            previous[key] = queries
+    return list(dict.fromkeys(problems))
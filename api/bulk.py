@@ -0,0 +1,144 @@
+from django.db import NotSupportedError, connections, router
+
+from . import models
+
+
+def bulk_insert(model, objs, batch_size=None):
+    """
+    bulk_create, после которого у всех объектов есть pk.
+
+    Django 3.2 возвращает pk из bulk_create только на PostgreSQL. На SQLite
+    pk читаются обратно: внутри транзакции вставленные строки получают
+    последние значения автоинкремента, так как SQLite не пускает других
+    писателей до конца транзакции. На остальных базах чужая вставка может
+    попасть в прочитанный диапазон, поэтому там bulk_insert не работает.
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    db = router.db_for_write(model)
+    connection = connections[db]
+    read_back = not connection.features.can_return_rows_from_bulk_insert
+    if read_back and connection.vendor != "sqlite":
+        raise NotSupportedError("bulk_insert не может получить pk вставленных строк на {}".format(connection.vendor))
+    if read_back and not connection.in_atomic_block:
+        raise RuntimeError("bulk_insert должен выполняться внутри transaction.atomic()")
+    model._base_manager.using(db).bulk_create(objs, batch_size=batch_size)
+    if not read_back:
+        return objs
+    pks = model._base_manager.using(db).order_by("-pk").values_list("pk", flat=True)[:len(objs)]
+    for obj, pk in zip(objs, reversed(list(pks))):
+        obj.pk = pk
+    return objs
+
+
+def create_tasks(exam_tasks, batch_size=None):
+    """
+    Создает задания и ответы для пар (exam, tasks_data) двумя bulk-вставками.
+    tasks_data - провалидированные данные TaskSerializer.
+    """
+    tasks = []
+    answers_data = []
+    for exam, tasks_data in exam_tasks:
+        for task_data in tasks_data:
+            task_data = dict(task_data)
+            task_data.pop("id", None)
+            answers = task_data.pop("answers", [])
+            correct_count = sum(1 for answer in answers if answer.get("is_correct"))
+            tasks.append(models.Task(exam=exam, correct_count=correct_count, **task_data))
+            answers_data.append(answers)
+    bulk_insert(models.Task, tasks, batch_size)
+    answers = []
+    for task, task_answers in zip(tasks, answers_data):
+        for answer_data in task_answers:
+            answer_data = dict(answer_data)
+            answer_data.pop("id", None)
+            answers.append(models.Answer(task=task, **answer_data))
+    models.Answer.objects.bulk_create(answers, batch_size=batch_size)
+    return tasks
+
+
+def _assign(instance, data, fields):
+    """Переносит поля из data в instance и сообщает, изменилось ли что-нибудь"""
+    changed = False
+    for field in fields:
+        if field in data and getattr(instance, field) != data[field]:
+            setattr(instance, field, data[field])
+            changed = True
+    return changed
+
+
+def sync_tasks(exam, tasks_data, batch_size=None):
+    """
+    Приводит задания и ответы контрольной к tasks_data.
+
+    Строки сопоставляются по id: найденные обновляются, только если
+    изменились, новые создаются, отсутствующие в tasks_data удаляются.
+    У найденных строк можно передать только часть полей (PATCH), остальные
+    берутся из базы, задание без answers сохраняет свои ответы. Новые строки
+    должны быть заданы полностью, см. ExamSerializer.validate_tasks.
+    Обновляет exam.task_count и exam.max_scores, но не сохраняет exam.
+    Возвращает True, если что-то было записано в базу.
+    """
+    existing_tasks = {task.pk: task for task in exam.tasks.all()}
+    existing_answers = {}
+    for answer in models.Answer.objects.filter(task__exam=exam):
+        existing_answers.setdefault(answer.task_id, {})[answer.pk] = answer
+
+    new_tasks = []
+    tasks_to_update = []
+    answers_to_create = []
+    answers_to_update = []
+    kept_tasks = set()
+    kept_answers = set()
+    max_scores = 0
+    for task_data in tasks_data:
+        task = existing_tasks.get(task_data.get("id"))
+        if task is None or task.pk in kept_tasks:
+            new_tasks.append(task_data)
+            max_scores += task_data["scores"]
+            continue
+        kept_tasks.add(task.pk)
+        task_answers = existing_answers.get(task.pk, {})
+        correct_count = 0
+        if "answers" not in task_data:
+            # Задание без answers (частичное обновление) сохраняет свои ответы
+            kept_answers.update(task_answers)
+            correct_count = task.correct_count
+        for answer_data in task_data.get("answers", []):
+            answer = task_answers.get(answer_data.get("id"))
+            if answer is None or answer.pk in kept_answers:
+                answer = models.Answer(task=task, text=answer_data["text"], is_correct=answer_data["is_correct"])
+                answers_to_create.append(answer)
+            else:
+                kept_answers.add(answer.pk)
+                # Непереданные поля остаются сохраненными
+                if _assign(answer, answer_data, ("text", "is_correct")):
+                    answers_to_update.append(answer)
+            correct_count += answer.is_correct
+        if _assign(task, dict(task_data, correct_count=correct_count), ("question", "scores", "correct_count")):
+            tasks_to_update.append(task)
+        max_scores += task.scores
+
+    tasks_to_delete = existing_tasks.keys() - kept_tasks
+    answers_to_delete = [pk for task_id, answers in existing_answers.items() if task_id in kept_tasks
+                         for pk in answers if pk not in kept_answers]
+    if tasks_to_delete:
+        tasks = models.Task.objects.filter(pk__in=tasks_to_delete)
+        tasks.keep_error_questions()
+        tasks.delete()
+    if answers_to_delete:
+        models.Answer.objects.filter(pk__in=answers_to_delete).delete()
+    if tasks_to_update:
+        models.Task.objects.bulk_update(tasks_to_update, ["question", "scores", "correct_count"], batch_size)
+    if answers_to_update:
+        models.Answer.objects.bulk_update(answers_to_update, ["text", "is_correct"], batch_size)
+    if answers_to_create:
+        models.Answer.objects.bulk_create(answers_to_create, batch_size=batch_size)
+    if new_tasks:
+        create_tasks([(exam, new_tasks)], batch_size)
+
+    exam.task_count = len(kept_tasks) + len(new_tasks)
+    exam.max_scores = max_scores
+    return any((tasks_to_delete, answers_to_delete, tasks_to_update,
+                answers_to_update, answers_to_create, new_tasks))
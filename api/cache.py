@@ -0,0 +1,117 @@
+"""
+Кэш API поверх django.core.cache.
+
+Записи группируются по пространствам имен. У каждого пространства есть
+версия, которая хранится в самом кэше и входит в ключи записей, поэтому
+bump() сразу делает устаревшими все записи пространства во всех воркерах.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+_MISSING = object()
+_SAFE_KEY = re.compile(r"^[\w.:-]*$", re.ASCII)
+_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def get_cache():
+    return caches[getattr(settings, "API_CACHE_ALIAS", "default")]
+
+
+def _version_key(namespace):
+    return "version:{}".format(namespace)
+
+
+def get_version(namespace):
+    """Текущая версия пространства имен"""
+    cache = get_cache()
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Начинаем со времени, чтобы после вытеснения версии не вернуться к старым записям
+        cache.add(_version_key(namespace), int(time.time() * 1000), timeout=None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def bump(namespace):
+    """Делает устаревшими все записи пространства имен"""
+    cache = get_cache()
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        get_version(namespace)
+
+
+def make_key(namespace, *parts):
+    """Ключ записи с учетом текущей версии пространства имен"""
+    key = ":".join(str(part) for part in parts)
+    if len(key) > 150 or not _SAFE_KEY.match(key):
+        key = hashlib.md5(key.encode()).hexdigest()
+    return "{}:{}:{}".format(namespace, get_version(namespace), key)
+
+
+def record(namespace, hit):
+    with _lock:
+        if hit:
+            _hits[namespace] += 1
+        else:
+            _misses[namespace] += 1
+
+
+def _lookup(namespace, key):
+    value = get_cache().get(key, _MISSING)
+    record(namespace, value is not _MISSING)
+    return value
+
+
+def get(namespace, *parts):
+    """Значение из кэша или None"""
+    return get_by_key(namespace, make_key(namespace, *parts))
+
+
+def get_by_key(namespace, key):
+    """
+    Значение по ключу из make_key или None. Ключ, вычисленный до чтения данных,
+    сохраняет версию: запись под ним после bump() уже не будет прочитана
+    """
+    value = _lookup(namespace, key)
+    return None if value is _MISSING else value
+
+
+def put(namespace, *parts, value, timeout=DEFAULT_TIMEOUT):
+    get_cache().set(make_key(namespace, *parts), value, timeout)
+
+
+def delete(namespace, *parts):
+    get_cache().delete(make_key(namespace, *parts))
+
+
+def get_or_set(namespace, *parts, default, timeout=DEFAULT_TIMEOUT):
+    """Значение из кэша, а при промахе - результат default(), который сохраняется"""
+    key = make_key(namespace, *parts)
+    value = _lookup(namespace, key)
+    if value is _MISSING:
+        value = default()
+        get_cache().set(key, value, timeout)
+    return value
+
+
+def stats():
+    """Счетчики попаданий и промахов этого процесса по пространствам имен"""
+    with _lock:
+        return {namespace: {"hits": _hits[namespace], "misses": _misses[namespace]}
+                for namespace in _hits.keys() | _misses.keys()}
+
+
+def reset_stats():
+    with _lock:
+        _hits.clear()
+        _misses.clear()
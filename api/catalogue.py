@@ -0,0 +1,59 @@
+"""
+Кэш каталога контрольных (/exams/).
+
+Готовый JSON страниц хранится в пространстве имен NAMESPACE, версия
+которого повышается, когда меняется что-то, что видно в каталоге:
+опубликованная контрольная, ее видимость или данные ее автора.
+Имена и аватарки комментаторов видны на странице контрольной, ETag
+которой тоже включает эту версию, поэтому их изменения повышают ее так же.
+Из сигналов версия повышается после фиксации транзакции: иначе запрос,
+пришедший до фиксации, положил бы старый список в кэш под новой версией.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache
+from .models import CustomUser, Exam, Profile
+
+NAMESPACE = "exam-catalogue"
+
+
+def invalidate():
+    cache.bump(NAMESPACE)
+
+
+def invalidate_on_commit():
+    transaction.on_commit(invalidate)
+
+
+def _is_visible(user_id):
+    # автор или комментатор опубликованной контрольной
+    return Exam.objects.filter(Q(author_id=user_id) | Q(comments__author_id=user_id), is_show=True).exists()
+
+
+@receiver(post_save, sender=Exam)
+def exam_saved(sender, instance, **kwargs):
+    if instance.is_show or instance.field_changed("is_show"):
+        invalidate_on_commit()
+
+
+@receiver(post_delete, sender=Exam)
+def exam_deleted(sender, instance, **kwargs):
+    if instance.is_show:
+        invalidate_on_commit()
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, created, **kwargs):
+    if not created and instance.field_changed("avatar") and _is_visible(instance.user_id):
+        invalidate_on_commit()
+
+
+@receiver(post_save, sender=CustomUser)
+def author_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    if (instance.field_changed("first_name") or instance.field_changed("last_name")) and _is_visible(instance.pk):
+        invalidate_on_commit()
@@ -0,0 +1,85 @@
+"""
+Потоковая выгрузка результатов контрольной в CSV и NDJSON.
+
+Строки читаются iterator() порциями по CHUNK_SIZE и сразу отдаются клиенту,
+поэтому память не зависит от количества попыток. Попытки упорядочены по
+индексу (exam, -start_time, -id), а число ошибок считается коррелированным
+подзапросом, чтобы база не сортировала и не группировала всю выборку
+до первой строки.
+"""
+import csv
+import io
+import json
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import ErrorStatistics, Statistics
+
+CHUNK_SIZE = 2000
+FIELDS = ("id", "user_id", "email", "first_name", "last_name", "grade", "total", "is_graded",
+          "start_time", "end_time", "errors")
+# Табличные редакторы выполняют ячейку с таким началом как формулу
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def exam_results(exam):
+    """Кортежи значений FIELDS для всех попыток контрольной"""
+    errors = (ErrorStatistics.objects.filter(statistics=OuterRef("pk")).order_by()
+              .values("statistics").annotate(count=Count("pk")).values("count"))
+    return (Statistics.objects.filter(exam=exam)
+            .annotate(errors_count=Coalesce(Subquery(errors, output_field=IntegerField()), 0))
+            .order_by("-start_time", "-id")
+            .values_list("pk", "user_id", "user__email", "user__first_name", "user__last_name", "grade", "total",
+                         "is_graded", "start_time", "end_time", "errors_count")
+            .iterator(chunk_size=CHUNK_SIZE))
+
+
+def _records(rows):
+    for row in rows:
+        record = dict(zip(FIELDS, row))
+        record["start_time"] = record["start_time"].isoformat()
+        record["end_time"] = record["end_time"].isoformat()
+        yield record
+
+
+def _chunks(lines):
+    """Склеивает строки в куски по CHUNK_SIZE, чтобы не отправлять каждую отдельно"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_SIZE:
+            yield "".join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield "".join(chunk).encode()
+
+
+def _csv_cell(value):
+    """Текст, который начинается как формула, экранируется апострофом"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    yield buffer.getvalue()
+    for record in _records(rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(_csv_cell(value) for value in record.values())
+        yield buffer.getvalue()
+
+
+def iter_csv(rows):
+    # Заголовок отправляется сразу, до первого запроса к базе
+    lines = _csv_lines(rows)
+    yield next(lines).encode()
+    yield from _chunks(lines)
+
+
+def iter_ndjson(rows):
+    yield from _chunks(json.dumps(record, ensure_ascii=False) + "\n" for record in _records(rows))
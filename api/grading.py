@@ -0,0 +1,157 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache
+from .models import Answer, ErrorStatistics, Exam, Statistics, Task
+
+TaskKey = namedtuple("TaskKey", ("id", "question", "scores", "correct", "answers"))
+
+
+class AlreadyGraded(Exception):
+    """Попытка уже оценена: повторная отправка открыла бы ключ ответов и позволила переписать оценку"""
+
+
+class AnswerKeyCache:
+    """
+    LRU-кэш ключей ответов в памяти процесса.
+    Ключ - id контрольной, версия - её edit_time: после редактирования
+    старая запись не используется, даже если сигнал не пришел.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._task_exams = {}
+        self._lock = threading.Lock()
+
+    def get(self, exam_id, version, loader):
+        with self._lock:
+            entry = self._entries.get(exam_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(exam_id)
+                self.hits += 1
+                cache.record("answer-key", True)
+                return entry[1]
+            self.misses += 1
+        cache.record("answer-key", False)
+        answer_key = loader()
+        with self._lock:
+            self._discard(exam_id)
+            self._entries[exam_id] = (version, answer_key)
+            for task in answer_key:
+                self._task_exams[task.id] = exam_id
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+        return answer_key
+
+    def invalidate(self, exam_id):
+        with self._lock:
+            self._discard(exam_id)
+
+    def invalidate_task(self, task_id):
+        with self._lock:
+            exam_id = self._task_exams.get(task_id)
+            if exam_id is not None:
+                self._discard(exam_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._task_exams.clear()
+
+    def _discard(self, exam_id):
+        entry = self._entries.pop(exam_id, None)
+        if entry is not None:
+            for task in entry[1]:
+                self._task_exams.pop(task.id, None)
+
+
+answer_keys = AnswerKeyCache(getattr(settings, "ANSWER_KEY_CACHE_SIZE", 256))
+
+
+@receiver([post_save, post_delete], sender=Exam)
+def invalidate_exam_answer_key(sender, instance, **kwargs):
+    answer_keys.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Task)
+def invalidate_task_answer_key(sender, instance, **kwargs):
+    answer_keys.invalidate(instance.exam_id)
+
+
+@receiver([post_save, post_delete], sender=Answer)
+def invalidate_answer_answer_key(sender, instance, **kwargs):
+    answer_keys.invalidate_task(instance.task_id)
+
+
+def load_answer_key(exam_id):
+    """Задания контрольной с множествами верных и всех ответов одним запросом"""
+    rows = (Task.objects.filter(exam_id=exam_id)
+            .order_by("pk")
+            .values_list("pk", "question", "scores", "answers__pk", "answers__is_correct"))
+    tasks = {}
+    for task_id, question, scores, answer_id, is_correct in rows:
+        if task_id not in tasks:
+            tasks[task_id] = (question, scores, set(), set())
+        if answer_id is not None:
+            tasks[task_id][3].add(answer_id)
+            if is_correct:
+                tasks[task_id][2].add(answer_id)
+    return tuple(TaskKey(task_id, question, scores, frozenset(correct), frozenset(answers))
+                 for task_id, (question, scores, correct, answers) in tasks.items())
+
+
+def get_answer_key(exam):
+    """Ключ ответов текущей версии контрольной"""
+    return answer_keys.get(exam.pk, exam.edit_time, lambda: load_answer_key(exam.pk))
+
+
+def score(answer_key, selections):
+    """
+    Оценивает ответы ученика.
+    selections - словарь {id задания: множество id выбранных ответов}.
+    Задание засчитывается, только если выбраны ровно все верные ответы.
+    Возвращает (grade, total, список TaskKey с ошибками).
+    """
+    grade = 0
+    total = 0
+    wrong = []
+    for task in answer_key:
+        total += task.scores
+        if selections.get(task.id, frozenset()) == task.correct:
+            grade += task.scores
+        else:
+            wrong.append(task)
+    return grade, total, wrong
+
+
+def submit(statistics, selections):
+    """
+    Выставляет оценку попытке и записывает ошибки одним bulk_create.
+    У ошибки сохраняется один из выбранных неверных ответов задания, если такой был.
+    Попытка оценивается один раз: ее сначала занимает условный UPDATE по
+    is_graded=False, поэтому из параллельных отправок проходит только одна,
+    остальные получают AlreadyGraded.
+    """
+    grade, total, wrong = score(get_answer_key(statistics.exam), selections)
+    with transaction.atomic():
+        if not Statistics.objects.filter(pk=statistics.pk, is_graded=False).update(is_graded=True):
+            raise AlreadyGraded(statistics.pk)
+        statistics.errors.all().delete()
+        ErrorStatistics.objects.bulk_create(
+            ErrorStatistics(statistics=statistics, task_id=task.id,
+                            answer_id=min((selections.get(task.id, frozenset()) & task.answers) - task.correct,
+                                          default=None))
+            for task in wrong)
+        statistics.grade = grade
+        statistics.total = total
+        statistics.is_graded = True
+        statistics.save(update_fields=["grade", "total", "is_graded", "end_time"])
+    return statistics
@@ -0,0 +1,59 @@
+import base64
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import CachedBasicAuthentication, CachedTokenAuthentication
+from api.models import CustomUser
+
+PASSWORD = "bench-password"
+
+
+class Command(BaseCommand):
+    help = ("Замеряет время и процессорное время аутентификации одного запроса для Basic, "
+            "Basic с кэшем проверенных паролей, Token, Token с кэшем и JWT. Данные не сохраняются")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        with transaction.atomic():
+            user = CustomUser.objects.create_user("bench-auth@example.com", PASSWORD, is_teacher=False)
+            token = "Token " + Token.objects.create(user=user).key
+            basic = "Basic " + base64.b64encode("{}:{}".format(user.email, PASSWORD).encode()).decode()
+            schemes = (
+                ("basic", BasicAuthentication(), basic),
+                ("basic-cached", CachedBasicAuthentication(), basic),
+                ("token", TokenAuthentication(), token),
+                ("token-cached", CachedTokenAuthentication(), token),
+                ("jwt", JWTAuthentication(), "Bearer {}".format(AccessToken.for_user(user))),
+            )
+            self.stdout.write("{:<14} {:>12} {:>12} {:>12} {:>8}".format(
+                "scheme", "p50, us", "mean, us", "cpu, us", "queries"))
+            for name, authenticator, header in schemes:
+                # Первый запрос заполняет кэш и не учитывается
+                authenticator.authenticate(Request(factory.get("/", HTTP_AUTHORIZATION=header)))
+                timings = []
+                cpu_start = time.process_time()
+                with CaptureQueriesContext(connection) as context:
+                    for _ in range(options["repeat"]):
+                        request = Request(factory.get("/", HTTP_AUTHORIZATION=header))
+                        start = time.perf_counter()
+                        authenticated, _ = authenticator.authenticate(request)
+                        timings.append((time.perf_counter() - start) * 1000000)
+                        assert authenticated.pk == user.pk
+                cpu = (time.process_time() - cpu_start) * 1000000 / options["repeat"]
+                self.stdout.write("{:<14} {:>12.1f} {:>12.1f} {:>12.1f} {:>8.1f}".format(
+                    name, statistics.median(timings), statistics.mean(timings), cpu,
+                    len(context) / options["repeat"]))
+            transaction.set_rollback(True)
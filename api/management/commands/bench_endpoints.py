@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import benchmark, budgets, seed
+
+
+class Command(BaseCommand):
+    help = ("Замеряет p50/p95 времени ответа и количество SQL-запросов для всех маршрутов API. "
+            "Изменения в базе откатываются. Результат можно сохранить в JSON и сравнить с предыдущим")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--only", help="Только маршруты, в имени которых есть эта строка")
+        parser.add_argument("--scale", type=float,
+                            help="Замерять на временных данных seed_perf_data этого масштаба, иначе на текущей базе")
+        parser.add_argument("--output", help="Сохранить результаты в JSON")
+        parser.add_argument("--compare", help="JSON предыдущего запуска для сравнения")
+        parser.add_argument("--threshold", type=float, default=20.0,
+                            help="Допустимое замедление p50 в процентах при сравнении")
+        parser.add_argument("--fail-on-regression", action="store_true",
+                            help="Завершиться с ошибкой, если есть регрессии")
+        parser.add_argument("--check-budgets", action="store_true",
+                            help="Завершиться с ошибкой, если маршрут превысил бюджет запросов из api.budgets")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat должен быть больше нуля")
+        baseline = benchmark.load(options["compare"]) if options["compare"] else None
+        self.stdout.write("{:<52} {:>6} {:>9} {:>9} {:>8}".format("endpoint", "status", "p50, ms", "p95, ms",
+                                                                  "queries"))
+        with transaction.atomic():
+            if options["scale"]:
+                seed.seed(options["scale"], prefix="bench")
+            try:
+                results = benchmark.run(options["repeat"], options["only"], log=self.log)
+            except benchmark.NoData as error:
+                raise CommandError(error)
+            if options["scale"]:
+                transaction.set_rollback(True)
+        for key in results["skipped"]:
+            self.stdout.write("{:<52} пропущен: нет тела запроса или объекта".format(key))
+        if options["output"]:
+            benchmark.dump(results, options["output"])
+            self.stdout.write("Результаты сохранены в {}".format(options["output"]))
+        if baseline is not None:
+            self.compare(baseline, results, options)
+        if options["check_budgets"]:
+            problems = budgets.check([results])
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(problem))
+            if problems:
+                raise CommandError("Превышены бюджеты запросов: {}".format(len(problems)))
+
+    def log(self, key, result):
+        self.stdout.write("{:<52} {:>6} {:>9.2f} {:>9.2f} {:>8}".format(
+            key, result["status"], result["p50_ms"], result["p95_ms"], result["queries"]))
+
+    def compare(self, baseline, results, options):
+        self.stdout.write("\nСравнение с {} ({})".format(options["compare"], baseline["meta"].get("commit")))
+        self.stdout.write("{:<52} {:>9} {:>9} {:>8} {:>13}".format("endpoint", "p50 до", "p50", "%", "queries"))
+        regressions = 0
+        for key, before, after, change, queries_before, queries_after, regression in benchmark.compare(
+                baseline, results, options["threshold"]):
+            line = "{:<52} {:>9.2f} {:>9.2f} {:>+8.1f} {:>6} -> {:<4}".format(
+                key, before, after, change, queries_before, queries_after)
+            regressions += regression
+            self.stdout.write(self.style.ERROR(line) if regression else line)
+        if regressions and options["fail_on_regression"]:
+            raise CommandError("Регрессий: {}".format(regressions))
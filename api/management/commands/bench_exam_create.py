@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Answer, CustomUser, Exam, Task
+from api.serializers import ExamSerializer
+
+
+def make_tasks(size, answers):
+    return [{"question": "Вопрос {}?".format(index),
+             "scores": 1,
+             "answers": [{"text": "Ответ {}".format(option), "is_correct": option == 0}
+                         for option in range(answers)]}
+            for index in range(size)]
+
+
+def create_row_by_row(validated_data):
+    """Прежний способ создания: по одному INSERT на задание и ответ"""
+    tasks = validated_data.pop("tasks")
+    exam = Exam.objects.create(**validated_data)
+    for task in tasks:
+        task = dict(task)
+        answers = task.pop("answers")
+        elem = Task.objects.create(exam=exam, **task)
+        for answer in answers:
+            Answer.objects.create(task=elem, **answer)
+    return exam
+
+
+class Command(BaseCommand):
+    help = "Замеряет время создания Exam с разным количеством заданий. Данные не сохраняются"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--answers", type=int, default=4, help="Вариантов ответа в задании")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write("{:>8} {:>12} {:>8} {:>14} {:>8}".format(
+            "tasks", "bulk, ms", "queries", "row-by-row, ms", "queries"))
+        for size in options["sizes"]:
+            bulk = self.measure(lambda data: ExamSerializer().create(data), size, options)
+            legacy = self.measure(create_row_by_row, size, options)
+            self.stdout.write("{:>8} {:>12.1f} {:>8} {:>14.1f} {:>8}".format(size, *bulk, *legacy))
+
+    def measure(self, create, size, options):
+        best = None
+        queries = 0
+        for _ in range(options["repeat"]):
+            with transaction.atomic():
+                author = CustomUser.objects.create(email="bench@example.com", is_teacher=True)
+                data = {"author": author, "title": "Benchmark", "classroom": 11, "subject": "al",
+                        "description": "", "tasks": make_tasks(size, options["answers"])}
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    with transaction.atomic():
+                        create(data)
+                    elapsed = (time.perf_counter() - start) * 1000
+                transaction.set_rollback(True)
+            queries = len(context)
+            best = elapsed if best is None else min(best, elapsed)
+        return best, queries
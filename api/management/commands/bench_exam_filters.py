@@ -0,0 +1,88 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import bulk, catalogue
+from api.models import CustomUser, Exam, Profile
+from api.views import ExamViewSet
+
+FILTERS = [
+    {},
+    {"subject": "al"},
+    {"classroom": 9},
+    {"subject": "ph", "classroom": 11},
+    {"author": None},
+    {"subject": "ru", "published_after": None},
+]
+
+
+class Command(BaseCommand):
+    help = ("Замеряет время отфильтрованного списка /exams/ на базе с большим количеством контрольных. "
+            "Сгенерированные данные не сохраняются")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--exams", type=int, default=100000)
+        parser.add_argument("--teachers", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--explain", action="store_true", help="Показать план запроса")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            start = time.perf_counter()
+            teachers = self.seed(options["exams"], options["teachers"])
+            self.stdout.write("Создано {} контрольных за {:.1f} с".format(
+                options["exams"], time.perf_counter() - start))
+            middle = Exam.objects.order_by("publish_time").values_list("publish_time", flat=True)[
+                options["exams"] // 2]
+            view = ExamViewSet.as_view({"get": "list"})
+            factory = APIRequestFactory()
+            self.stdout.write("{:<60} {:>9} {:>9} {:>8}".format("filter", "p50, ms", "p95, ms", "queries"))
+            for params in FILTERS:
+                params = dict(params)
+                if "author" in params:
+                    params["author"] = teachers[0].pk
+                if "published_after" in params:
+                    params["published_after"] = middle.timestamp()
+                timings = []
+                for _ in range(options["repeat"]):
+                    catalogue.invalidate()
+                    request = factory.get("/api/v1/exams/", params)
+                    force_authenticate(request, user=teachers[0])
+                    with CaptureQueriesContext(connection) as context:
+                        started = time.perf_counter()
+                        view(request).render()
+                        timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write("{:<60} {:>9.2f} {:>9.2f} {:>8}".format(
+                    str(params), statistics.median(timings), timings[int(len(timings) * 0.95) - 1],
+                    len(context)))
+                if options["explain"]:
+                    self.stdout.write(context.captured_queries[-1]["sql"])
+                    with connection.cursor() as cursor:
+                        cursor.execute("EXPLAIN QUERY PLAN " + context.captured_queries[-1]["sql"])
+                        for row in cursor.fetchall():
+                            self.stdout.write("    {}".format(row[-1]))
+            transaction.set_rollback(True)
+
+    def seed(self, exams, teachers):
+        password = make_password("password")
+        users = bulk.bulk_insert(CustomUser, (
+            CustomUser(email="bench{}@example.com".format(index), password=password,
+                       first_name="Teacher", last_name=str(index), is_teacher=True)
+            for index in range(teachers)))
+        Profile.objects.bulk_create(Profile(user=user) for user in users)
+        subjects = [choice for choice, _ in Exam.SUBJECT_CHOICES]
+        classrooms = [choice for choice, _ in Exam.CLASSROOM]
+        random.seed(0)
+        Exam.objects.bulk_create(
+            (Exam(author=random.choice(users), title="Exam {}".format(index), description="",
+                  subject=random.choice(subjects), classroom=random.choice(classrooms))
+             for index in range(exams)),
+            batch_size=5000)
+        return users
@@ -0,0 +1,44 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import transfer
+from api.models import CustomUser, Exam
+
+
+class Command(BaseCommand):
+    help = "Выгружает контрольные в NDJSON (или gzip, если файл заканчивается на .gz)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл или - для stdout")
+        parser.add_argument("--author", help="Только контрольные автора с этим email")
+        parser.add_argument("--gzip", action="store_true", help="Сжать gzip")
+        parser.add_argument("--batch-size", type=int, default=transfer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        exams = Exam.objects.all()
+        if options["author"]:
+            try:
+                exams = exams.filter(author=CustomUser.objects.get(email=options["author"]))
+            except CustomUser.DoesNotExist:
+                raise CommandError("Пользователь {} не найден".format(options["author"]))
+        path = options["path"]
+        compress = options["gzip"] or path.endswith(".gz")
+        start = time.perf_counter()
+        count = -1
+        if path == "-":
+            output = gzip.open(sys.stdout.buffer, "wt", encoding="utf-8") if compress else sys.stdout
+        else:
+            output = gzip.open(path, "wt", encoding="utf-8") if compress else open(path, "w", encoding="utf-8")
+        try:
+            for line in transfer.export_exams(exams, options["batch_size"]):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        seconds = time.perf_counter() - start
+        self.stderr.write("Выгружено контрольных: {} за {:.2f} с ({:.0f} в секунду)".format(
+            count, seconds, count / seconds if seconds else 0))
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import transfer
+from api.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Загружает контрольные из NDJSON или gzip, выгруженных export_exams"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл или - для stdin")
+        parser.add_argument("--author", help="Email владельца всех загружаемых контрольных")
+        parser.add_argument("--create-authors", action="store_true",
+                            help="Создавать отсутствующих авторов (без пароля)")
+        parser.add_argument("--batch-size", type=int, default=transfer.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        author = None
+        if options["author"]:
+            try:
+                author = CustomUser.objects.get(email=options["author"])
+            except CustomUser.DoesNotExist:
+                raise CommandError("Пользователь {} не найден".format(options["author"]))
+        if options["path"] == "-":
+            result = self.load(sys.stdin.buffer, author, options)
+        else:
+            with open(options["path"], "rb") as stream:
+                result = self.load(stream, author, options)
+        for error in result.errors:
+            self.stderr.write("Строка {}: {}".format(error["line"], error["error"]))
+        self.stdout.write(self.style.SUCCESS(
+            "Загружено контрольных: {}, заданий: {}, с ошибками: {} за {:.2f} с ({:.0f} контрольных в секунду)".format(
+                result.exams, result.tasks, result.failed, result.seconds, result.exams_per_second)))
+
+    def load(self, stream, author, options):
+        return transfer.import_exams(stream, author=author, create_authors=options["create_authors"],
+                                     batch_size=options["batch_size"])
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from api.models import Exam, Task
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает task_count, max_scores у Exam и correct_count у Task"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Только проверить, не изменяя данные")
+
+    def handle(self, *args, **options):
+        broken_exams = Exam.objects.with_summary().exclude(task_count=F("actual_task_count"),
+                                                           max_scores=F("actual_max_scores"))
+        broken_tasks = Task.objects.with_correct_count().exclude(correct_count=F("actual_correct_count"))
+        exams = broken_exams.count()
+        tasks = broken_tasks.count()
+        self.stdout.write("Несогласованных контрольных: {}, заданий: {}".format(exams, tasks))
+        if options["check"]:
+            if exams or tasks:
+                raise CommandError("Сводные поля не совпадают с данными")
+            return
+        with transaction.atomic():
+            updated_tasks = Task.objects.refresh_correct_count()
+            updated_exams = Exam.objects.refresh_summary()
+        self.stdout.write(self.style.SUCCESS(
+            "Пересчитано контрольных: {}, заданий: {}".format(updated_exams, updated_tasks)))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Строит заново полнотекстовый индекс контрольных"
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS("Проиндексировано контрольных: {} за {:.1f} с".format(
+            count, time.perf_counter() - start)))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import progress
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает итоги учеников по контрольным и предметам из оцененных попыток"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users",
+                            help="Только для пользователя с этим id, можно указать несколько раз")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        exams, subjects = progress.rebuild(user_ids=options["users"])
+        self.stdout.write(self.style.SUCCESS(
+            "Итогов по контрольным: {}, по предметам: {} за {:.1f} с".format(
+                exams, subjects, time.perf_counter() - start)))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import seed
+
+
+class Command(BaseCommand):
+    help = ("Заполняет базу синтетическими учителями, учениками, контрольными, комментариями и попытками "
+            "для нагрузочных замеров. Пароль всех пользователей - \"{}\"".format(seed.PASSWORD))
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=float, default=1.0,
+                            help="Масштаб: 1 - {}".format(", ".join(
+                                "{} {}".format(count, name) for name, count in seed.VOLUMES.items())))
+        parser.add_argument("--prefix", default="perf", help="Префикс email созданных пользователей")
+        parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора случайных чисел")
+        parser.add_argument("--clear", action="store_true", help="Сначала удалить данные с этим префиксом")
+
+    def handle(self, *args, **options):
+        if options["scale"] <= 0:
+            raise CommandError("--scale должен быть больше нуля")
+        prefix = options["prefix"]
+        if options["clear"]:
+            self.stdout.write("Удалено строк: {}".format(seed.clear(prefix)))
+        elif seed.exists(prefix):
+            raise CommandError("Данные с префиксом {} уже есть, укажите --clear или другой --prefix".format(prefix))
+        start = time.perf_counter()
+        counts = seed.seed(options["scale"], prefix, options["seed"])
+        for name, count in counts.items():
+            self.stdout.write("{:<12} {:>10}".format(name, count))
+        self.stdout.write(self.style.SUCCESS("Готово за {:.1f} с".format(time.perf_counter() - start)))
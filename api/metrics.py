@@ -0,0 +1,195 @@
+"""
+Метрики запросов API в памяти процесса.
+
+Для каждого запроса MetricsMiddleware считает задержку, количество и время
+SQL-запросов и время сериализации (TimedSerializerMixin) и складывает их
+в registry по view и action. Метрики отдаются в текстовом формате Prometheus
+на /metrics, у каждого воркера свои счетчики.
+
+Настройки - словарь API_METRICS, ключи и значения по умолчанию в DEFAULTS.
+"""
+import contextvars
+import functools
+import hmac
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from . import cache
+
+logger = logging.getLogger("api.metrics")
+
+DEFAULTS = {
+    "ENABLED": True,
+    "SERVER_TIMING": True,
+    # Запрос с MIN_ITEMS и более объектами в ответе и больше чем
+    # MAX_QUERIES_PER_ITEM запросами к базе на объект считается N+1
+    "MAX_QUERIES_PER_ITEM": 1,
+    "MIN_ITEMS": 5,
+    "MAX_QUERIES": 50,
+    # /metrics доступен сотрудникам (is_staff) и по заголовку Authorization: Bearer <TOKEN>
+    "TOKEN": None,
+}
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_current = contextvars.ContextVar("api_metrics", default=None)
+
+
+def get_setting(name):
+    return getattr(settings, "API_METRICS", {}).get(name, DEFAULTS[name])
+
+
+def can_view(request):
+    """Можно ли отдать метрики: токен API_METRICS["TOKEN"] или сессия сотрудника"""
+    token = get_setting("TOKEN")
+    if token:
+        expected = "Bearer {}".format(token).encode()
+        if hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", "").encode(), expected):
+            return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+class RequestMetrics:
+    """Счетчики одного запроса. Экземпляр - обертка connection.execute_wrapper"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self._serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def server_timing(self, latency):
+        return 'db;dur={:.1f};desc="{} queries", serializer;dur={:.1f}, total;dur={:.1f}'.format(
+            self.db_time * 1000, self.queries, self.serializer_time * 1000, latency * 1000)
+
+
+def activate(state):
+    return _current.set(state)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def timed(func):
+    """Добавляет время работы func ко времени сериализации текущего запроса"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        state = _current.get()
+        if state is None or state._serializing:
+            return func(*args, **kwargs)
+        state._serializing = True
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            state.serializer_time += time.perf_counter() - start
+            state._serializing = False
+    return wrapper
+
+
+def count_items(data):
+    """Количество объектов в ответе: страница, список или один объект"""
+    if isinstance(data, dict) and isinstance(data.get("results"), list):
+        return len(data["results"])
+    if isinstance(data, list):
+        return len(data)
+    return 1 if data else 0
+
+
+class Series:
+    __slots__ = ("count", "latency", "buckets", "queries", "db_time", "serializer_time", "n_plus_one")
+
+    def __init__(self):
+        self.count = 0
+        self.latency = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.n_plus_one = 0
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, latency, state, items):
+        """Учитывает запрос, возвращает True, если он похож на N+1"""
+        flagged = state.queries > get_setting("MAX_QUERIES") or (
+            items >= get_setting("MIN_ITEMS") and state.queries > items * get_setting("MAX_QUERIES_PER_ITEM"))
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = Series()
+            series.count += 1
+            series.latency += latency
+            for index, bound in enumerate(BUCKETS):
+                if latency <= bound:
+                    series.buckets[index] += 1
+            series.queries += state.queries
+            series.db_time += state.db_time
+            series.serializer_time += state.serializer_time
+            series.n_plus_one += flagged
+        if flagged:
+            logger.warning("Возможен N+1: %s %s, %d запросов к базе на %d объектов",
+                           labels[0], labels[1], state.queries, items)
+        return flagged
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            series = sorted(self._series.items())
+            lines = []
+            for name, kind, help_text, value in (
+                    ("api_requests_total", "counter", "Количество запросов", lambda s: s.count),
+                    ("api_db_queries_total", "counter", "Количество SQL-запросов", lambda s: s.queries),
+                    ("api_db_duration_seconds_total", "counter", "Время SQL-запросов", lambda s: s.db_time),
+                    ("api_serializer_duration_seconds_total", "counter", "Время сериализации",
+                     lambda s: s.serializer_time),
+                    ("api_n_plus_one_total", "counter", "Запросы сверх порогов API_METRICS",
+                     lambda s: s.n_plus_one)):
+                lines += ["# HELP {} {}".format(name, help_text), "# TYPE {} {}".format(name, kind)]
+                lines += ["{}{{{}}} {}".format(name, _labels(labels), value(item)) for labels, item in series]
+            lines += ["# HELP api_request_duration_seconds Задержка ответа",
+                      "# TYPE api_request_duration_seconds histogram"]
+            for labels, item in series:
+                for bound, count in zip(BUCKETS, item.buckets):
+                    lines.append('api_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                        _labels(labels), bound, count))
+                lines.append('api_request_duration_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                    _labels(labels), item.count))
+                lines.append("api_request_duration_seconds_sum{{{}}} {}".format(_labels(labels), item.latency))
+                lines.append("api_request_duration_seconds_count{{{}}} {}".format(_labels(labels), item.count))
+        lines += ["# HELP api_cache_requests_total Обращения к кэшу API",
+                  "# TYPE api_cache_requests_total counter"]
+        for namespace, counts in sorted(cache.stats().items()):
+            for result, key in (("hit", "hits"), ("miss", "misses")):
+                lines.append('api_cache_requests_total{{namespace="{}",result="{}"}} {}'.format(
+                    namespace, result, counts[key]))
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    view, action, method = labels
+    return 'view="{}",action="{}",method="{}"'.format(view, action, method)
+
+
+registry = Registry()
@@ -0,0 +1,47 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+
+
+def _view_labels(request):
+    """Имя класса view и action (для viewset) или метод запроса"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    view = getattr(match.func, "cls", None)
+    name = view.__name__ if view is not None else match.func.__name__
+    actions = getattr(match.func, "actions", None) or {}
+    return name, actions.get(request.method.lower(), request.method.lower()), request.method
+
+
+class MetricsMiddleware:
+    """
+    Считает задержку, SQL-запросы и время сериализации каждого запроса,
+    отдает их заголовком Server-Timing и складывает в metrics.registry.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics.get_setting("ENABLED"):
+            return self.get_response(request)
+        state = metrics.RequestMetrics()
+        token = metrics.activate(state)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(state))
+                response = self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+        latency = time.perf_counter() - state.start
+        labels = _view_labels(request)
+        if labels is not None:
+            metrics.registry.observe(labels, latency, state, metrics.count_items(getattr(response, "data", None)))
+        if metrics.get_setting("SERVER_TIMING"):
+            response["Server-Timing"] = state.server_timing(latency)
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.7 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_auto_20210924_2328'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(fields=['is_show', '-publish_time', '-id'], name='exam_show_publish_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(fields=['author', '-publish_time', '-id'], name='exam_author_publish_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statistics',
+            index=models.Index(fields=['user', '-start_time', '-id'], name='statistics_user_start_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.7 on 2026-10-18 14:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_summary(apps, schema_editor):
+    Exam = apps.get_model("api", "Exam")
+    Task = apps.get_model("api", "Task")
+    Answer = apps.get_model("api", "Answer")
+    tasks = Task.objects.filter(exam=OuterRef("pk")).order_by().values("exam")
+    Exam.objects.update(
+        task_count=Coalesce(Subquery(tasks.annotate(count=Count("pk")).values("count")), 0),
+        max_scores=Coalesce(Subquery(tasks.annotate(total=Sum("scores")).values("total")), 0),
+    )
+    answers = Answer.objects.filter(task=OuterRef("pk"), is_correct=True).order_by().values("task")
+    Task.objects.update(
+        correct_count=Coalesce(Subquery(answers.annotate(count=Count("pk")).values("count")), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='max_scores',
+            field=models.PositiveIntegerField(default=0, verbose_name='Максимальное количество баллов'),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='task_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество заданий'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='correct_count',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Количество верных ответов'),
+        ),
+        migrations.RunPython(fill_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.7 on 2026-10-18 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_exam_summary_fields'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='exam',
+            name='exam_show_publish_idx',
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(condition=models.Q(('is_show', True)), fields=['-publish_time', '-id'], name='exam_shown_publish_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(condition=models.Q(('is_show', True)), fields=['subject', 'classroom', '-publish_time', '-id'], name='exam_subject_class_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(condition=models.Q(('is_show', True)), fields=['subject', '-publish_time', '-id'], name='exam_subject_publish_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exam',
+            index=models.Index(condition=models.Q(('is_show', True)), fields=['classroom', '-publish_time', '-id'], name='exam_class_publish_idx'),
+        ),
+    ]
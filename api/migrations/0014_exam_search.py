@@ -0,0 +1,47 @@
+# Generated by Django 3.2.7 on 2026-10-18 15:04
+
+from django.db import OperationalError, migrations, models, transaction
+import django.db.models.deletion
+
+
+def create_fts_table(apps, schema_editor):
+    # Таблица FTS5 создается, только если SQLite собран с этим модулем,
+    # иначе api.search использует ExamSearchTerm. Индекс заполняется командой rebuild_search_index
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    try:
+        with transaction.atomic(using=connection.alias):
+            schema_editor.execute("CREATE VIRTUAL TABLE api_exam_search USING fts5(title, description, questions)")
+    except OperationalError:
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS api_exam_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_exam_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='Основа слова')),
+                ('weight', models.FloatField(verbose_name='Вес')),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='api.exam', verbose_name='Контрольная')),
+            ],
+            options={
+                'verbose_name': 'Поисковый терм',
+                'verbose_name_plural': 'Поисковые термы',
+                'unique_together': {('term', 'exam')},
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.7 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_exam_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='statistics',
+            index=models.Index(fields=['exam', '-start_time', '-id'], name='statistics_exam_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statistics',
+            index=models.Index(fields=['exam', 'grade'], name='statistics_exam_grade_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 3.2.7 on 2026-10-18 15:07
+
+from itertools import islice
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def bulk_update_in_batches(model, objects, fields):
+    # объекты приходят генератором и в памяти держится только одна пачка
+    objects = iter(objects)
+    batch = list(islice(objects, BATCH_SIZE))
+    while batch:
+        model.objects.bulk_update(batch, fields)
+        batch = list(islice(objects, BATCH_SIZE))
+
+
+def map_errors_to_tasks(apps, schema_editor):
+    # Ошибка сопоставляется заданию своей контрольной с тем же текстом вопроса
+    # (при повторах - первому). Несопоставленные ошибки сохраняют текст
+    ErrorStatistics = apps.get_model("api", "ErrorStatistics")
+    Task = apps.get_model("api", "Task")
+    tasks = {}
+    for pk, exam_id, question in Task.objects.order_by("-pk").values_list("pk", "exam_id", "question"):
+        tasks[exam_id, question] = pk
+    errors = ErrorStatistics.objects.filter(task__isnull=True).values_list("pk", "statistics__exam_id", "question")
+    mapped = (ErrorStatistics(pk=pk, task_id=tasks[exam_id, question], question=None)
+              for pk, exam_id, question in errors.iterator(chunk_size=BATCH_SIZE) if (exam_id, question) in tasks)
+    bulk_update_in_batches(ErrorStatistics, mapped, ["task", "question"])
+
+
+def restore_questions(apps, schema_editor):
+    ErrorStatistics = apps.get_model("api", "ErrorStatistics")
+    errors = ErrorStatistics.objects.filter(task__isnull=False).values_list("pk", "task__question")
+    restored = (ErrorStatistics(pk=pk, question=question) for pk, question in errors.iterator(chunk_size=BATCH_SIZE))
+    bulk_update_in_batches(ErrorStatistics, restored, ["question"])
+    ErrorStatistics.objects.filter(question__isnull=True).update(question="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_statistics_exam_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='errorstatistics',
+            name='answer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='errors', to='api.answer', verbose_name='Выбранный неверный ответ'),
+        ),
+        migrations.AddField(
+            model_name='errorstatistics',
+            name='task',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='errors', to='api.task', verbose_name='Задание'),
+        ),
+        migrations.AlterField(
+            model_name='errorstatistics',
+            name='question',
+            field=models.TextField(blank=True, null=True, verbose_name='Вопрос'),
+        ),
+        migrations.RunPython(map_errors_to_tasks, restore_questions),
+    ]
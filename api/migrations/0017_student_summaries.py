@@ -0,0 +1,64 @@
+# Generated by Django 3.2.7 on 2026-10-18 15:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def mark_graded(apps, schema_editor):
+    # Раньше оценка выставлялась клиентом после создания попытки с нулевой оценкой.
+    # Итоги строятся командой rebuild_student_summaries
+    Statistics = apps.get_model("api", "Statistics")
+    Statistics.objects.filter(models.Q(grade__gt=0) | models.Q(errors__isnull=False)).update(is_graded=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_error_statistics_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statistics',
+            name='is_graded',
+            field=models.BooleanField(default=False, verbose_name='Оценена'),
+        ),
+        migrations.CreateModel(
+            name='StudentSubjectSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(choices=[('al', 'Алгебра'), ('as', 'Астрономия'), ('bi', 'Биология'), ('ch', 'Химия'), ('en', 'Английский'), ('gm', 'Геометрия'), ('hi', 'История'), ('ph', 'Физика'), ('ru', 'Русский язык'), ('cs', 'Информатика'), ('ss', 'Обществознание'), ('gg', 'География'), ('fl', 'Иностранный язык'), ('li', 'Литература'), ('ob', 'ОБЖ'), ('dp', 'Другой предмет')], max_length=2, verbose_name='Предмет')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Количество попыток')),
+                ('best_percent', models.FloatField(default=0, verbose_name='Лучший результат, %')),
+                ('last_percent', models.FloatField(default=0, verbose_name='Последний результат, %')),
+                ('percent_sum', models.FloatField(default=0, verbose_name='Сумма результатов, %')),
+                ('last_time', models.DateTimeField(null=True, verbose_name='Время последней попытки')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_summaries', to=settings.AUTH_USER_MODEL, verbose_name='Ученик')),
+            ],
+            options={
+                'verbose_name': 'Итоги по предмету',
+                'verbose_name_plural': 'Итоги по предметам',
+                'unique_together': {('user', 'subject')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentExamSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Количество попыток')),
+                ('best_grade', models.IntegerField(default=0, verbose_name='Лучшая оценка')),
+                ('last_grade', models.IntegerField(default=0, verbose_name='Последняя оценка')),
+                ('grade_sum', models.IntegerField(default=0, verbose_name='Сумма оценок')),
+                ('last_time', models.DateTimeField(null=True, verbose_name='Время последней попытки')),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_summaries', to='api.exam', verbose_name='Контрольная')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_summaries', to=settings.AUTH_USER_MODEL, verbose_name='Ученик')),
+            ],
+            options={
+                'verbose_name': 'Итоги по контрольной',
+                'verbose_name_plural': 'Итоги по контрольным',
+                'unique_together': {('user', 'exam')},
+            },
+        ),
+        migrations.RunPython(mark_graded, migrations.RunPython.noop),
+    ]
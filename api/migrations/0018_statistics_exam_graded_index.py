@@ -0,0 +1,21 @@
+# Generated by Django 3.2.7 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_student_summaries'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='statistics',
+            name='statistics_exam_grade_idx',
+        ),
+        migrations.AddIndex(
+            model_name='statistics',
+            index=models.Index(fields=['exam', 'is_graded', 'grade'], name='statistics_exam_graded_idx'),
+        ),
+    ]
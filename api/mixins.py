@@ -0,0 +1,101 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import cache, metrics
+
+
+class ConditionalMixin:
+    """
+    Условные GET-запросы: ETag и Last-Modified вычисляются одним
+    агрегирующим запросом, и при совпадении отдается 304 без сериализации.
+    """
+
+    def get_conditional_state(self, queryset):
+        """
+        Словарь значений, от которых зависит ответ, или None, если объектов нет.
+        Значения с ключами *_time дают Last-Modified.
+        """
+        state = queryset.aggregate(edit_time=Max("edit_time"), count=Count("pk"))
+        return state if state["edit_time"] else None
+
+    def conditional(self, request, queryset, render):
+        state = self.get_conditional_state(queryset.prefetch_related(None))
+        if state is None:
+            return render()
+        times = [value for key, value in state.items() if key.endswith("_time") and value]
+        last_modified = int(max(times).timestamp()) if times else None
+        fingerprint = "{}:{}".format(request.accepted_renderer.format, sorted(state.items()))
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render()
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+
+class ConditionalRetrieveMixin(ConditionalMixin):
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return self.conditional(request, queryset, lambda: super(ConditionalRetrieveMixin, self).retrieve(
+            request, *args, **kwargs))
+
+
+class ConditionalListMixin(ConditionalMixin):
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional(request, queryset, lambda: super(ConditionalListMixin, self).list(
+            request, *args, **kwargs))
+
+
+class CachedListMixin:
+    """
+    Готовый JSON списка хранится в кэше в пространстве имен cache_namespace.
+    Ключ - адрес сервера и параметры запроса, поэтому ответ должен быть одинаковым
+    для всех пользователей.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != "json":
+            return super().list(request, *args, **kwargs)
+        # Ключ с версией вычисляется до чтения данных: если bump() произойдет
+        # до рендера, ответ сохранится под старой версией и не будет прочитан
+        key = cache.make_key(self.cache_namespace, request.scheme, request.get_host(),
+                             sorted(request.query_params.lists()))
+        content = cache.get_by_key(self.cache_namespace, key)
+        if content is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response.add_post_render_callback(lambda rendered: cache.get_cache().set(key, rendered.content))
+            response["X-Cache"] = "MISS"
+            return response
+        # Ответ уже отрендерен, DRF не будет сериализовать его повторно
+        response = Response()
+        response.content = content
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = "{}; charset={}".format(content_type, renderer.charset)
+        response["Content-Type"] = content_type
+        response["X-Cache"] = "HIT"
+        return response
+
+
+class TimedSerializerMixin:
+    """Время работы to_representation сериалайзеров view попадает в метрики запроса"""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        serializer.to_representation = metrics.timed(serializer.to_representation)
+        return serializer
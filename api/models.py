@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import Count, Sum
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
 from django.db.models.signals import post_save
@@ -6,6 +9,44 @@ from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
 
+class LoadedValuesMixin:
+    """Запоминает значения полей, загруженные из базы или последний раз сохраненные"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._snapshot(field_names)
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            attnames = [field.attname for field in self._meta.concrete_fields
+                        if field.attname not in self.get_deferred_fields()]
+        else:
+            attnames = [self._meta.get_field(name).attname for name in update_fields]
+        self._loaded_values = dict(getattr(self, "_loaded_values", {}), **self._snapshot(attnames))
+
+    def _snapshot(self, attnames):
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in attnames:
+                value = getattr(self, field.attname)
+                if isinstance(value, FieldFile):
+                    value = value.name or None
+                values[field.attname] = value
+        return values
+
+    def field_changed(self, name):
+        """Отличается ли поле от загруженного из базы. Для новых объектов всегда True"""
+        attname = self._meta.get_field(name).attname
+        loaded_values = getattr(self, "_loaded_values", {})
+        if attname not in loaded_values:
+            return True
+        return self._snapshot([attname])[attname] != loaded_values[attname]
+
+
 class CustomUserManager(BaseUserManager):
     """
     Custom user model manager where email is the unique identifiers
@@ -39,7 +80,7 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 
 
-class CustomUser(AbstractUser):
+class CustomUser(LoadedValuesMixin, AbstractUser):
     username = None
     first_name = models.CharField("Имя", max_length=100)
     last_name = models.CharField("Фамилия", max_length=100)
@@ -72,11 +113,16 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=CustomUser)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def save_user_profile(sender, instance, created, **kwargs):
+    """Сохраняет профиль, загруженный вместе с пользователем, только если он изменился"""
+    if created or not CustomUser.profile.is_cached(instance):
+        return
+    profile = instance.profile
+    if any(profile.field_changed(field.name) for field in profile._meta.concrete_fields):
+        profile.save()
 
 
-class Profile(models.Model):
+class Profile(LoadedValuesMixin, models.Model):
     user = models.OneToOneField(CustomUser, verbose_name="Пользователь", related_name="profile",
                                 on_delete=models.CASCADE)
     avatar = models.ImageField("Аватарка", upload_to="user/", null=True, blank=True)
@@ -89,7 +135,42 @@ class Profile(models.Model):
         return self.user.email
 
 
-class Exam(models.Model):
+class ExamQuerySet(models.QuerySet):
+
+    def with_summary(self):
+        """Добавляет фактические количество заданий и максимальный балл одним запросом"""
+        return self.annotate(actual_task_count=Count("tasks"),
+                             actual_max_scores=Coalesce(Sum("tasks__scores"), 0))
+
+    def refresh_summary(self):
+        """Пересчитывает task_count и max_scores одним UPDATE"""
+        tasks = Task.objects.filter(exam=models.OuterRef("pk")).order_by().values("exam")
+        return self.update(
+            task_count=Coalesce(models.Subquery(tasks.annotate(count=Count("pk")).values("count")), 0),
+            max_scores=Coalesce(models.Subquery(tasks.annotate(total=Sum("scores")).values("total")), 0),
+        )
+
+
+class TaskQuerySet(models.QuerySet):
+
+    def with_correct_count(self):
+        """Добавляет фактическое количество верных ответов"""
+        return self.annotate(actual_correct_count=Count("answers", filter=models.Q(answers__is_correct=True)))
+
+    def refresh_correct_count(self):
+        """Пересчитывает correct_count одним UPDATE"""
+        answers = Answer.objects.filter(task=models.OuterRef("pk"), is_correct=True).order_by().values("task")
+        return self.update(
+            correct_count=Coalesce(models.Subquery(answers.annotate(count=Count("pk")).values("count")), 0),
+        )
+
+    def keep_error_questions(self):
+        """Копирует текст вопроса в ошибки по заданиям одним UPDATE, вызывается перед удалением заданий"""
+        questions = Task.objects.filter(pk=models.OuterRef("task_id")).values("question")
+        return ErrorStatistics.objects.filter(task__in=self).update(question=models.Subquery(questions))
+
+
+class Exam(LoadedValuesMixin, models.Model):
     SUBJECT_CHOICES = [
         ("al", "Алгебра"),
         ("as", "Астрономия"),
@@ -129,20 +210,65 @@ class Exam(models.Model):
     publish_time = models.DateTimeField("Время публикации", auto_now_add=True)
     edit_time = models.DateTimeField("Время изменения", auto_now=True)
     is_show = models.BooleanField("Видимость", default=True)
+    task_count = models.PositiveIntegerField("Количество заданий", default=0)
+    max_scores = models.PositiveIntegerField("Максимальное количество баллов", default=0)
+
+    objects = ExamQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Контрольная"
         verbose_name_plural = "Контрольные"
         ordering = ("-publish_time",)
+        # Частичные индексы по опубликованным контрольным: SQLite не использует
+        # составной индекс с is_show для условия WHERE "is_show", которое строит Django
+        indexes = [
+            models.Index(fields=["-publish_time", "-id"], name="exam_shown_publish_idx",
+                         condition=models.Q(is_show=True)),
+            models.Index(fields=["author", "-publish_time", "-id"], name="exam_author_publish_idx"),
+            models.Index(fields=["subject", "classroom", "-publish_time", "-id"], name="exam_subject_class_idx",
+                         condition=models.Q(is_show=True)),
+            models.Index(fields=["subject", "-publish_time", "-id"], name="exam_subject_publish_idx",
+                         condition=models.Q(is_show=True)),
+            models.Index(fields=["classroom", "-publish_time", "-id"], name="exam_class_publish_idx",
+                         condition=models.Q(is_show=True)),
+        ]
 
     def __str__(self):
         return self.title
 
+    def refresh_summary(self):
+        """Пересчитывает task_count и max_scores после изменения заданий"""
+        summary = self.tasks.aggregate(task_count=Count("pk"), max_scores=Coalesce(Sum("scores"), 0))
+        self.task_count = summary["task_count"]
+        self.max_scores = summary["max_scores"]
+        self.save(update_fields=["task_count", "max_scores", "edit_time"])
+
+
+class ExamSearchTerm(models.Model):
+    """Запись поискового индекса, когда SQLite собран без FTS5 (см. api.search)"""
+    TERM_LENGTH = 64
+
+    term = models.CharField("Основа слова", max_length=TERM_LENGTH)
+    exam = models.ForeignKey(Exam, verbose_name="Контрольная", related_name="search_terms",
+                             on_delete=models.CASCADE)
+    weight = models.FloatField("Вес")
+
+    class Meta:
+        verbose_name = "Поисковый терм"
+        verbose_name_plural = "Поисковые термы"
+        unique_together = ("term", "exam")
+
+    def __str__(self):
+        return self.term
+
 
 class Task(models.Model):
     exam = models.ForeignKey(Exam, verbose_name="Упражнение", related_name="tasks", on_delete=models.CASCADE)
     question = models.TextField("Вопрос")
     scores = models.SmallIntegerField("Максимальное количество баллов")
+    correct_count = models.PositiveSmallIntegerField("Количество верных ответов", default=0)
+
+    objects = TaskQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Задание"
@@ -151,6 +277,11 @@ class Task(models.Model):
     def __str__(self):
         return self.question
 
+    def refresh_correct_count(self):
+        """Пересчитывает correct_count после изменения ответов"""
+        self.correct_count = self.answers.filter(is_correct=True).count()
+        self.save(update_fields=["correct_count"])
+
 
 class Answer(models.Model):
     task = models.ForeignKey(Task, verbose_name="Ответ", related_name="answers", on_delete=models.CASCADE)
@@ -182,7 +313,7 @@ class Comment(models.Model):
         return self.text
 
 
-class Statistics(models.Model):
+class Statistics(LoadedValuesMixin, models.Model):
     user = models.ForeignKey(CustomUser, verbose_name="Пользователь", related_name="statistics",
                              on_delete=models.CASCADE)
     exam = models.ForeignKey(Exam, verbose_name="Упражнение", related_name="statistics", on_delete=models.CASCADE)
@@ -190,11 +321,17 @@ class Statistics(models.Model):
     total = models.SmallIntegerField("Общее количество баллов")
     start_time = models.DateTimeField("Начало выполнения", auto_now_add=True)
     end_time = models.DateTimeField("Конец выполнения", auto_now=True)
+    is_graded = models.BooleanField("Оценена", default=False)
 
     class Meta:
         ordering = ("-start_time",)
         verbose_name = "Статистика"
         verbose_name_plural = "Статистика"
+        indexes = [
+            models.Index(fields=["user", "-start_time", "-id"], name="statistics_user_start_idx"),
+            models.Index(fields=["exam", "-start_time", "-id"], name="statistics_exam_start_idx"),
+            models.Index(fields=["exam", "is_graded", "grade"], name="statistics_exam_graded_idx"),
+        ]
 
     def __str__(self):
         return self.exam.title
@@ -203,11 +340,70 @@ class Statistics(models.Model):
 class ErrorStatistics(models.Model):
     statistics = models.ForeignKey(Statistics, verbose_name="Ошибки", related_name="errors",
                                    on_delete=models.CASCADE)
-    question = models.TextField("Вопрос")
+    task = models.ForeignKey(Task, verbose_name="Задание", related_name="errors", null=True, blank=True,
+                             on_delete=models.SET_NULL)
+    answer = models.ForeignKey(Answer, verbose_name="Выбранный неверный ответ", related_name="errors", null=True,
+                               blank=True, on_delete=models.SET_NULL)
+    # Текст вопроса хранится только у ошибок без задания: старых записей и ошибок удаленных заданий
+    question = models.TextField("Вопрос", null=True, blank=True)
 
     class Meta:
         verbose_name = "Ошибка"
         verbose_name_plural = "Ошибки"
 
     def __str__(self):
-        return self.question
+        return self.question_text or ""
+
+    @property
+    def question_text(self):
+        return self.task.question if self.task_id else self.question
+
+
+class StudentExamSummary(models.Model):
+    """Итоги оцененных попыток ученика по контрольной, обновляются api.progress"""
+    user = models.ForeignKey(CustomUser, verbose_name="Ученик", related_name="exam_summaries",
+                             on_delete=models.CASCADE)
+    exam = models.ForeignKey(Exam, verbose_name="Контрольная", related_name="student_summaries",
+                             on_delete=models.CASCADE)
+    attempts = models.PositiveIntegerField("Количество попыток", default=0)
+    best_grade = models.IntegerField("Лучшая оценка", default=0)
+    last_grade = models.IntegerField("Последняя оценка", default=0)
+    grade_sum = models.IntegerField("Сумма оценок", default=0)
+    last_time = models.DateTimeField("Время последней попытки", null=True)
+
+    class Meta:
+        verbose_name = "Итоги по контрольной"
+        verbose_name_plural = "Итоги по контрольным"
+        unique_together = ("user", "exam")
+
+    def __str__(self):
+        return "{} - {}".format(self.user, self.exam)
+
+    @property
+    def mean_grade(self):
+        return self.grade_sum / self.attempts if self.attempts else None
+
+
+class StudentSubjectSummary(models.Model):
+    """Итоги оцененных попыток ученика по предмету в процентах от максимума, обновляются api.progress"""
+    user = models.ForeignKey(CustomUser, verbose_name="Ученик", related_name="subject_summaries",
+                             on_delete=models.CASCADE)
+    subject = models.CharField("Предмет", max_length=2, choices=Exam.SUBJECT_CHOICES)
+    attempts = models.PositiveIntegerField("Количество попыток", default=0)
+    best_percent = models.FloatField("Лучший результат, %", default=0)
+    last_percent = models.FloatField("Последний результат, %", default=0)
+    percent_sum = models.FloatField("Сумма результатов, %", default=0)
+    last_time = models.DateTimeField("Время последней попытки", null=True)
+
+    class Meta:
+        verbose_name = "Итоги по предмету"
+        verbose_name_plural = "Итоги по предметам"
+        unique_together = ("user", "subject")
+
+    def __str__(self):
+        return "{} - {}".format(self.user, self.get_subject_display())
+
+    @property
+    def mean_percent(self):
+        return self.percent_sum / self.attempts if self.attempts else None
+
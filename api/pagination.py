@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ExamCursorPagination(CursorPagination):
+    """Постраничный вывод Exam по времени публикации"""
+    ordering = ("-publish_time", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class StatisticsCursorPagination(CursorPagination):
+    """Постраничный вывод Statistics по времени начала выполнения"""
+    ordering = ("-start_time", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
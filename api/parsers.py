@@ -0,0 +1,19 @@
+from rest_framework.parsers import BaseParser
+
+
+class StreamParser(BaseParser):
+    """
+    Не читает тело запроса: request.data - поток, который обработчик читает
+    порциями сам. Используется для больших загрузок (api.transfer).
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
+
+
+class NDJSONParser(StreamParser):
+    media_type = "application/x-ndjson"
+
+
+class GzipParser(StreamParser):
+    media_type = "application/gzip"
@@ -7,3 +7,13 @@ class IsTeacherUser(BasePermission):
     """
     def has_permission(self, request, view):
         return bool(request.user and request.user.is_teacher or request.method in ["GET"])
+
+
+class IsExamAuthor(BasePermission):
+    """
+    The exam's results are available only to its author
+    """
+    message = "Результаты контрольной доступны только ее автору"
+
+    def has_object_permission(self, request, view, obj):
+        return obj.author_id == request.user.pk
@@ -0,0 +1,161 @@
+"""
+Итоги учеников по контрольным (StudentExamSummary) и предметам (StudentSubjectSummary).
+
+Первая оценка попытки прибавляется к итогам одним UPDATE с F-выражениями.
+Повторная оценка и удаление попытки пересчитывают затронутые строки агрегатом
+по Statistics: лучшую оценку нельзя вычесть.
+"""
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import CustomUser, Exam, Statistics, StudentExamSummary, StudentSubjectSummary
+
+BATCH_SIZE = 1000
+# Контрольные и пользователи, удаляемые в этом потоке: их попытки удаляются
+# каскадом. Итоги по контрольной пересчитываются один раз после ее удаления,
+# итоги пользователя удаляются вместе с ним
+_deleting = threading.local()
+
+PERCENT = Case(
+    When(total__gt=0, then=ExpressionWrapper(F("grade") * Value(100.0) / F("total"), output_field=FloatField())),
+    default=Value(0.0),
+    output_field=FloatField(),
+)
+
+
+def percent(grade, total):
+    return grade * 100 / total if total > 0 else 0.0
+
+
+def _add(model, lookup, created, increments):
+    """Прибавляет попытку к строке итогов или создает строку"""
+    with transaction.atomic():
+        if model.objects.filter(**lookup).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **created)
+        except IntegrityError:
+            model.objects.filter(**lookup).update(**increments)
+
+
+def add_attempt(statistics):
+    """Учитывает впервые оцененную попытку"""
+    grade = statistics.grade
+    _add(StudentExamSummary, {"user_id": statistics.user_id, "exam_id": statistics.exam_id},
+         {"attempts": 1, "best_grade": grade, "last_grade": grade, "grade_sum": grade,
+          "last_time": statistics.end_time},
+         {"attempts": F("attempts") + 1, "best_grade": Greatest("best_grade", Value(grade)), "last_grade": grade,
+          "grade_sum": F("grade_sum") + grade, "last_time": statistics.end_time})
+    value = percent(grade, statistics.total)
+    _add(StudentSubjectSummary, {"user_id": statistics.user_id, "subject": statistics.exam.subject},
+         {"attempts": 1, "best_percent": value, "last_percent": value, "percent_sum": value,
+          "last_time": statistics.end_time},
+         {"attempts": F("attempts") + 1, "best_percent": Greatest("best_percent", Value(value)),
+          "last_percent": value, "percent_sum": F("percent_sum") + value, "last_time": statistics.end_time})
+
+
+def rebuild(user_ids=None, exam_ids=None, subjects=None):
+    """
+    Пересчитывает итоги по оцененным попыткам.
+    None в параметре - без ограничения: rebuild() строит все итоги заново.
+    Возвращает количество строк итогов по контрольным и по предметам.
+    """
+    graded = Statistics.objects.filter(is_graded=True).order_by()
+    exam_rows = StudentExamSummary.objects.all()
+    subject_rows = StudentSubjectSummary.objects.all()
+    if user_ids is not None:
+        graded = graded.filter(user_id__in=user_ids)
+        exam_rows = exam_rows.filter(user_id__in=user_ids)
+        subject_rows = subject_rows.filter(user_id__in=user_ids)
+    by_exam = graded
+    by_subject = graded
+    if exam_ids is not None:
+        by_exam = by_exam.filter(exam_id__in=exam_ids)
+        exam_rows = exam_rows.filter(exam_id__in=exam_ids)
+    if subjects is not None:
+        by_subject = by_subject.filter(exam__subject__in=subjects)
+        subject_rows = subject_rows.filter(subject__in=subjects)
+
+    latest = Statistics.objects.filter(is_graded=True, user=OuterRef("user")).order_by("-end_time", "-pk")
+    by_exam = by_exam.values("user", "exam").annotate(
+        attempts=Count("pk"), best_grade=Max("grade"), grade_sum=Sum("grade"), last_time=Max("end_time"),
+        last_grade=Subquery(latest.filter(exam=OuterRef("exam")).values("grade")[:1]))
+    by_subject = by_subject.annotate(percent=PERCENT).values("user", "exam__subject").annotate(
+        attempts=Count("pk"), best_percent=Max("percent"), percent_sum=Sum("percent"), last_time=Max("end_time"),
+        last_percent=Subquery(latest.filter(exam__subject=OuterRef("exam__subject"))
+                              .annotate(percent=PERCENT).values("percent")[:1]))
+    with transaction.atomic():
+        exam_rows.delete()
+        subject_rows.delete()
+        exams = StudentExamSummary.objects.bulk_create(
+            (StudentExamSummary(user_id=row.pop("user"), exam_id=row.pop("exam"), **row) for row in by_exam),
+            batch_size=BATCH_SIZE)
+        subjects = StudentSubjectSummary.objects.bulk_create(
+            (StudentSubjectSummary(user_id=row.pop("user"), subject=row.pop("exam__subject"), **row)
+             for row in by_subject),
+            batch_size=BATCH_SIZE)
+    return len(exams), len(subjects)
+
+
+def _rebuild_attempt(statistics):
+    rebuild(user_ids=[statistics.user_id], exam_ids=[statistics.exam_id], subjects=[statistics.exam.subject])
+
+
+@receiver(post_save, sender=Statistics)
+def statistics_saved(sender, instance, created, **kwargs):
+    if instance.field_changed("is_graded"):
+        if instance.is_graded:
+            add_attempt(instance)
+        elif not created:
+            _rebuild_attempt(instance)
+    elif instance.is_graded and (instance.field_changed("grade") or instance.field_changed("total")):
+        _rebuild_attempt(instance)
+
+
+@receiver(post_delete, sender=Statistics)
+def statistics_deleted(sender, instance, **kwargs):
+    if (instance.is_graded and instance.exam_id not in getattr(_deleting, "exams", {})
+            and instance.user_id not in getattr(_deleting, "users", set())):
+        _rebuild_attempt(instance)
+
+
+@receiver(pre_delete, sender=Exam)
+def exam_deleting(sender, instance, **kwargs):
+    if not hasattr(_deleting, "exams"):
+        _deleting.exams = {}
+    _deleting.exams[instance.pk] = set(
+        instance.statistics.filter(is_graded=True).values_list("user_id", flat=True).distinct())
+
+
+@receiver(post_delete, sender=Exam)
+def exam_deleted(sender, instance, **kwargs):
+    user_ids = getattr(_deleting, "exams", {}).pop(instance.pk, None)
+    if user_ids:
+        rebuild(user_ids=user_ids, exam_ids=[], subjects=[instance.subject])
+
+
+@receiver(post_save, sender=Exam)
+def exam_saved(sender, instance, created, **kwargs):
+    if created or not instance.field_changed("subject"):
+        return
+    user_ids = set(instance.statistics.filter(is_graded=True).values_list("user_id", flat=True).distinct())
+    if user_ids:
+        rebuild(user_ids=user_ids, exam_ids=[], subjects=[instance._loaded_values["subject"], instance.subject])
+
+
+@receiver(pre_delete, sender=CustomUser)
+def user_deleting(sender, instance, **kwargs):
+    if not hasattr(_deleting, "users"):
+        _deleting.users = set()
+    _deleting.users.add(instance.pk)
+
+
+@receiver(post_delete, sender=CustomUser)
+def user_deleted(sender, instance, **kwargs):
+    getattr(_deleting, "users", set()).discard(instance.pk)
@@ -0,0 +1,41 @@
+import csv
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+def _rows(data):
+    if isinstance(data, dict):
+        return [data]
+    return list(data or [])
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV для выгрузок. Большие выгрузки отдаются потоком (api.export),
+    рендерер выбирает формат и отображает ошибки.
+    """
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = _rows(data)
+        if not rows:
+            return b""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """JSON-объект на строку, см. CSVRenderer"""
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in _rows(data)).encode(self.charset)
@@ -0,0 +1,216 @@
+"""
+Полнотекстовый поиск по контрольным.
+
+Индексируются тема и описание контрольной и вопросы ее заданий. Слова
+приводятся к основе стеммером Портера для русского языка, поэтому
+"квадратное уравнение" находит "Квадратные уравнения".
+
+Если SQLite собран с FTS5, индекс хранится в виртуальной таблице
+api_exam_search (rowid = id контрольной) и ранжируется bm25. Иначе
+используется таблица ExamSearchTerm: основа слова, контрольная и вес.
+Индекс обновляется сигналами при сохранении и удалении контрольной.
+"""
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Exam, ExamSearchTerm, Task
+
+FTS_TABLE = "api_exam_search"
+# Веса полей: совпадение в теме важнее совпадения в вопросе
+WEIGHTS = {"title": 10.0, "description": 3.0, "questions": 1.0}
+MAX_TERMS = 8
+BATCH_SIZE = 500
+# Поля, после изменения которых контрольную нужно переиндексировать.
+# Вопросы заданий меняются вместе с task_count и max_scores (см. ExamSerializer.update)
+INDEXED_FIELDS = {"title", "description", "task_count", "max_scores"}
+
+_WORD = re.compile(r"[^\W_]+")
+_CYRILLIC = re.compile(r"[а-я]")
+# Есть ли таблица FTS5 в базе, по имени базы: тесты работают с отдельной базой
+_fts_tables = {}
+STOP_WORDS = frozenset((
+    "а", "без", "бы", "в", "во", "вы", "да", "для", "до", "его", "ее", "если", "же", "за", "и", "из",
+    "или", "их", "к", "как", "ко", "ли", "на", "над", "не", "нет", "ни", "но", "о", "об", "от", "по",
+    "под", "при", "с", "со", "так", "то", "у", "что", "это",
+))
+
+_VOWELS = "аеиоуыэюя"
+_RV = re.compile(r"^(.*?[{}])(.*)$".format(_VOWELS))
+_PERFECTIVE_GROUND = re.compile(r"((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$")
+_REFLEXIVE = re.compile(r"(с[яь])$")
+_ADJECTIVE = re.compile(r"(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$")
+_PARTICIPLE = re.compile(r"((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$")
+_VERB = re.compile(r"((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|"
+                   r"ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$")
+_NOUN = re.compile(r"(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|"
+                   r"ию|ью|ю|ия|ья|я)$")
+_DERIVATIONAL = re.compile(r".*[^{0}]+[{0}]+[^{0}]+[{0}]+.*ость?$".format(_VOWELS))
+_DERIVATIONAL_SUFFIX = re.compile(r"ость?$")
+_SUPERLATIVE = re.compile(r"(ейше|ейш)$")
+
+
+def stem(word):
+    """Основа русского слова (алгоритм Портера), остальные слова не меняются"""
+    match = _RV.match(word)
+    if not match or not _CYRILLIC.search(word):
+        return word
+    start, rv = match.groups()
+    temp = _PERFECTIVE_GROUND.sub("", rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub("", rv, 1)
+        temp = _ADJECTIVE.sub("", rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub("", temp, 1)
+        else:
+            temp = _VERB.sub("", rv, 1)
+            rv = _NOUN.sub("", rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+    if rv.endswith("и"):
+        rv = rv[:-1]
+    if _DERIVATIONAL.match(rv):
+        rv = _DERIVATIONAL_SUFFIX.sub("", rv, 1)
+    if rv.endswith("ь"):
+        rv = rv[:-1]
+    else:
+        rv = _SUPERLATIVE.sub("", rv, 1)
+        if rv.endswith("нн"):
+            rv = rv[:-1]
+    return start + rv
+
+
+def terms(text):
+    """Основы слов текста в порядке появления, без стоп-слов"""
+    return [stem(word) for word in _WORD.findall(text.lower().replace("ё", "е"))
+            if word not in STOP_WORDS]
+
+
+def use_fts():
+    backend = getattr(settings, "EXAM_SEARCH_BACKEND", "auto")
+    if backend != "auto":
+        return backend == "fts5"
+    name = connection.settings_dict["NAME"]
+    if name not in _fts_tables:
+        _fts_tables[name] = (connection.vendor == "sqlite"
+                             and FTS_TABLE in connection.introspection.table_names())
+    return _fts_tables[name]
+
+
+def index_exams(exam_ids):
+    """Переиндексирует контрольные (удаленные просто исчезают из индекса)"""
+    exam_ids = list(exam_ids)
+    for offset in range(0, len(exam_ids), BATCH_SIZE):
+        batch = exam_ids[offset:offset + BATCH_SIZE]
+        questions = defaultdict(list)
+        for exam_id, question in Task.objects.filter(exam_id__in=batch).order_by("pk").values_list(
+                "exam_id", "question"):
+            questions[exam_id].append(question)
+        documents = [
+            (exam_id, {"title": terms(title), "description": terms(description),
+                       "questions": terms(" ".join(questions[exam_id]))})
+            for exam_id, title, description in Exam.objects.filter(pk__in=batch).values_list(
+                "pk", "title", "description")
+        ]
+        remove_exams(batch)
+        if use_fts():
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    "INSERT INTO {} (rowid, title, description, questions) VALUES (%s, %s, %s, %s)".format(FTS_TABLE),
+                    [(exam_id, " ".join(fields["title"]), " ".join(fields["description"]),
+                      " ".join(fields["questions"])) for exam_id, fields in documents])
+        else:
+            ExamSearchTerm.objects.bulk_create(
+                (ExamSearchTerm(exam_id=exam_id, term=term[:ExamSearchTerm.TERM_LENGTH], weight=weight)
+                 for exam_id, fields in documents
+                 for term, weight in _weights(fields).items()),
+                batch_size=BATCH_SIZE)
+
+
+def _weights(fields):
+    weights = Counter()
+    for field, field_terms in fields.items():
+        for term in field_terms:
+            weights[term[:ExamSearchTerm.TERM_LENGTH]] += WEIGHTS[field]
+    return weights
+
+
+def remove_exams(exam_ids):
+    exam_ids = list(exam_ids)
+    if not exam_ids:
+        return
+    if use_fts():
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {} WHERE rowid IN ({})".format(FTS_TABLE, ", ".join(["%s"] * len(exam_ids))),
+                           exam_ids)
+    else:
+        ExamSearchTerm.objects.filter(exam_id__in=exam_ids).delete()
+
+
+def rebuild():
+    """Строит индекс заново для всех контрольных, возвращает их количество"""
+    if use_fts():
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {}".format(FTS_TABLE))
+    else:
+        ExamSearchTerm.objects.all().delete()
+    exam_ids = list(Exam.objects.order_by("pk").values_list("pk", flat=True))
+    index_exams(exam_ids)
+    return len(exam_ids)
+
+
+def search(query, limit=20, shown_only=True):
+    """
+    id контрольных, содержащих все слова запроса, от самых релевантных.
+    limit=None - без ограничения.
+    """
+    query_terms = list(dict.fromkeys(terms(query)))[:MAX_TERMS]
+    if not query_terms:
+        return []
+    if use_fts():
+        return _search_fts(query_terms, limit, shown_only)
+    return _search_terms(query_terms, limit, shown_only)
+
+
+def _search_fts(query_terms, limit, shown_only):
+    sql = ("SELECT {table}.rowid FROM {table} INNER JOIN api_exam e ON e.id = {table}.rowid "
+           "WHERE {table} MATCH %s {shown} ORDER BY bm25({table}, %s, %s, %s), e.publish_time DESC {limit}").format(
+        table=FTS_TABLE, shown="AND e.is_show" if shown_only else "", limit="LIMIT %s" if limit else "")
+    # Основы состоят только из букв и цифр, но кавычки защищают от операторов FTS5 (AND, NEAR, ...)
+    params = [" ".join('"{}"'.format(term) for term in query_terms),
+              WEIGHTS["title"], WEIGHTS["description"], WEIGHTS["questions"]]
+    if limit:
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_terms(query_terms, limit, shown_only):
+    matches = ExamSearchTerm.objects.filter(term__in=[term[:ExamSearchTerm.TERM_LENGTH] for term in query_terms])
+    if shown_only:
+        matches = matches.filter(exam__is_show=True)
+    matches = (matches.values("exam").annotate(rank=Sum("weight"), matched=Count("term"))
+               .filter(matched=len(query_terms)).order_by("-rank", "-exam__publish_time")
+               .values_list("exam", flat=True))
+    return list(matches[:limit] if limit else matches)
+
+
+@receiver(post_save, sender=Exam)
+def exam_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Новую контрольную индексирует тот, кто создает ее задания (ExamSerializer.create, админка)
+    if created:
+        return
+    if update_fields is None or INDEXED_FIELDS & set(update_fields):
+        index_exams([instance.pk])
+
+
+@receiver(post_delete, sender=Exam)
+def exam_deleted(sender, instance, **kwargs):
+    if use_fts():
+        remove_exams([instance.pk])
@@ -0,0 +1,151 @@
+"""
+Синтетические данные для нагрузочных замеров.
+
+Объемы задаются масштабом: scale=1 - VOLUMES учителей, учеников, контрольных
+и т. д., scale=10 - в десять раз больше. Все строки создаются bulk-вставками
+в одной транзакции, сигналы моделей не вызываются, поэтому профили, итоги
+учеников и поисковый индекс строятся отдельно в конце.
+Пользователи получают email <prefix>-teacher<N>@example.com и
+<prefix>-student<N>@example.com, по префиксу данные можно удалить.
+"""
+import random
+import re
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import bulk, catalogue, progress, search
+from .models import Answer, Comment, CustomUser, ErrorStatistics, Exam, Profile, Statistics
+
+PASSWORD = "password"
+BATCH_SIZE = 2000
+VOLUMES = {
+    "teachers": 10,
+    "students": 200,
+    "exams": 100,
+    "attempts": 2000,
+}
+TASKS_PER_EXAM = (5, 15)
+ANSWERS_PER_TASK = 4
+COMMENTS_PER_EXAM = (0, 6)
+WORDS = ("уравнение", "функция", "производная", "интеграл", "треугольник", "окружность", "скорость",
+         "энергия", "атом", "молекула", "реакция", "клетка", "растение", "животное", "материк",
+         "климат", "революция", "империя", "реформа", "глагол", "причастие", "падеж", "поэма",
+         "роман", "герой", "алгоритм", "массив", "число", "дробь", "степень", "корень", "закон")
+
+
+def get_volumes(scale, volumes=None):
+    result = {name: max(1, round(count * scale)) for name, count in VOLUMES.items()}
+    result.update(volumes or {})
+    return result
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _users(prefix, role, count, password, is_teacher):
+    users = bulk.bulk_insert(CustomUser, (
+        CustomUser(email="{}-{}{}@example.com".format(prefix, role, index), password=password,
+                   first_name=role.capitalize(), last_name=str(index), is_teacher=is_teacher)
+        for index in range(count)), batch_size=BATCH_SIZE)
+    Profile.objects.bulk_create((Profile(user=user) for user in users), batch_size=BATCH_SIZE)
+    return users
+
+
+def seed(scale=1, prefix="perf", random_seed=0, volumes=None):
+    """
+    Создает данные масштаба scale, volumes - явные объемы вместо масштабированных VOLUMES.
+    Возвращает количество созданных строк по моделям.
+    """
+    rng = random.Random(random_seed)
+    volumes = get_volumes(scale, volumes)
+    password = make_password(PASSWORD)
+    subjects = [choice for choice, _ in Exam.SUBJECT_CHOICES]
+    classrooms = [choice for choice, _ in Exam.CLASSROOM]
+    with transaction.atomic():
+        teachers = _users(prefix, "teacher", volumes["teachers"], password, True)
+        students = _users(prefix, "student", volumes["students"], password, False)
+
+        exam_tasks = []
+        for index in range(volumes["exams"]):
+            tasks = [{"question": _text(rng, 6) + "?", "scores": rng.randint(1, 5),
+                      "answers": [{"text": _text(rng, 2), "is_correct": option == 0}
+                                  for option in range(ANSWERS_PER_TASK)]}
+                     for _ in range(rng.randint(*TASKS_PER_EXAM))]
+            exam = Exam(author=rng.choice(teachers), title=_text(rng, 3), description=_text(rng, 12),
+                        subject=rng.choice(subjects), classroom=rng.choice(classrooms),
+                        is_show=rng.random() < 0.9, task_count=len(tasks),
+                        max_scores=sum(task["scores"] for task in tasks))
+            exam_tasks.append((exam, tasks))
+        exams = bulk.bulk_insert(Exam, (exam for exam, _ in exam_tasks), batch_size=BATCH_SIZE)
+        tasks = bulk.create_tasks(exam_tasks, batch_size=BATCH_SIZE)
+
+        Comment.objects.bulk_create(
+            (Comment(exam=exam, author=rng.choice(students), text=_text(rng, 8))
+             for exam in exams for _ in range(rng.randint(*COMMENTS_PER_EXAM))),
+            batch_size=BATCH_SIZE)
+
+        exam_keys = {exam.pk: [] for exam in exams}
+        for task in tasks:
+            exam_keys[task.exam_id].append(task)
+        answers = {}
+        for task_id, answer_id, is_correct in Answer.objects.filter(task__in=tasks).values_list(
+                "task_id", "pk", "is_correct"):
+            answers.setdefault(task_id, []).append((answer_id, is_correct))
+
+        attempts = []
+        attempt_errors = []
+        for _ in range(volumes["attempts"]):
+            exam = rng.choice(exams)
+            wrong = [task for task in exam_keys[exam.pk] if rng.random() < 0.3]
+            attempts.append(Statistics(user=rng.choice(students), exam=exam, is_graded=True,
+                                       grade=exam.max_scores - sum(task.scores for task in wrong),
+                                       total=exam.max_scores))
+            attempt_errors.append([
+                (task, rng.choice([pk for pk, is_correct in answers[task.pk] if not is_correct]))
+                for task in wrong])
+        bulk.bulk_insert(Statistics, attempts, batch_size=BATCH_SIZE)
+        errors = ErrorStatistics.objects.bulk_create(
+            (ErrorStatistics(statistics=attempt, task=task, answer_id=answer_id)
+             for attempt, task_errors in zip(attempts, attempt_errors) for task, answer_id in task_errors),
+            batch_size=BATCH_SIZE)
+        # auto_now_add ставит всем попыткам одно время, разносим их по последним 90 дням
+        now = timezone.now()
+        for attempt in attempts:
+            attempt.start_time = now - timedelta(minutes=rng.randint(60, 90 * 24 * 60))
+            attempt.end_time = attempt.start_time + timedelta(minutes=rng.randint(5, 45))
+        Statistics.objects.bulk_update(attempts, ["start_time", "end_time"], batch_size=BATCH_SIZE)
+
+        progress.rebuild(user_ids=[student.pk for student in students])
+        search.index_exams([exam.pk for exam in exams])
+    catalogue.invalidate()
+    return {
+        "teachers": len(teachers),
+        "students": len(students),
+        "exams": len(exams),
+        "tasks": len(tasks),
+        "answers": sum(len(items) for items in answers.values()),
+        "comments": Comment.objects.filter(exam__in=exams).count(),
+        "statistics": len(attempts),
+        "errors": len(errors),
+    }
+
+
+def _seeded_users(prefix):
+    pattern = r"^{}-(teacher|student)[0-9]+@example\.com$".format(re.escape(prefix))
+    return CustomUser.objects.filter(email__regex=pattern)
+
+
+def exists(prefix="perf"):
+    return _seeded_users(prefix).exists()
+
+
+def clear(prefix="perf"):
+    """Удаляет пользователей с префиксом prefix вместе с их контрольными и попытками"""
+    with transaction.atomic():
+        count, _ = _seeded_users(prefix).delete()
+    catalogue.invalidate()
+    return count
@@ -1,4 +1,8 @@
-from . import models
+from datetime import datetime, timezone
+
+from . import bulk, models, search
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
 from drf_extra_fields.fields import Base64ImageField
 
@@ -133,13 +137,15 @@ class TaskSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation["many_option"] = instance.answers.filter(is_correct=True).count() > 1
+        representation["many_option"] = instance.correct_count > 1
         return representation
 
 
 class ExamListSerializer(serializers.ModelSerializer):
     """Сериалайзер для списка Exercise"""
     author = AuthorSerializer()
+    count_task = serializers.IntegerField(source="task_count", read_only=True)
+    max_scores = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = models.Exam
@@ -149,7 +155,9 @@ class ExamListSerializer(serializers.ModelSerializer):
                   "classroom",
                   "subject",
                   "publish_time",
-                  "edit_time",)
+                  "edit_time",
+                  "count_task",
+                  "max_scores",)
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -158,10 +166,55 @@ class ExamListSerializer(serializers.ModelSerializer):
         return representation
 
 
+class TimestampField(serializers.FloatField):
+    """Unix timestamp, значение - datetime в UTC"""
+    default_error_messages = {
+        "invalid": "Ожидается unix timestamp.",
+    }
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        try:
+            return datetime.fromtimestamp(value, timezone.utc)
+        except (OverflowError, ValueError, OSError):
+            # nan, inf и время за пределами datetime
+            self.fail("invalid")
+
+
+class ExamFilterSerializer(serializers.Serializer):
+    """Параметры фильтрации списка Exam, время - unix timestamp"""
+    subject = serializers.ChoiceField(choices=models.Exam.SUBJECT_CHOICES, required=False)
+    classroom = serializers.ChoiceField(choices=models.Exam.CLASSROOM, required=False)
+    author = serializers.IntegerField(required=False)
+    published_after = TimestampField(required=False)
+    published_before = TimestampField(required=False)
+
+    def filter_queryset(self, queryset):
+        data = self.validated_data
+        for field in ("subject", "classroom"):
+            if field in data:
+                queryset = queryset.filter(**{field: data[field]})
+        if "author" in data:
+            queryset = queryset.filter(author_id=data["author"])
+        if "published_after" in data:
+            queryset = queryset.filter(publish_time__gte=data["published_after"])
+        if "published_before" in data:
+            queryset = queryset.filter(publish_time__lt=data["published_before"])
+        return queryset
+
+
+class ExamSearchSerializer(serializers.Serializer):
+    """Параметры полнотекстового поиска по Exam"""
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=20)
+
+
 class ExamRetrieveSerializer(serializers.ModelSerializer):
     """Сериалайзер для Exercise с полной информацией, но без Task"""
     author = AuthorSerializer()
     comments = CommentForExamSerializer(many=True)
+    count_task = serializers.IntegerField(source="task_count", read_only=True)
+    max_scores = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = models.Exam
@@ -173,23 +226,22 @@ class ExamRetrieveSerializer(serializers.ModelSerializer):
                   "subject",
                   "publish_time",
                   "edit_time",
-                  "comments")
+                  "comments",
+                  "count_task",
+                  "max_scores")
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation["count_task"] = instance.tasks.count()
         representation["publish_time"] = instance.publish_time.timestamp()
         representation["edit_time"] = instance.edit_time.timestamp()
-        max_scores = 0
-        for task in instance.tasks.all():
-            max_scores += task.scores
-        representation["max_scores"] = max_scores
         return representation
 
 
 class ExamSerializer(serializers.ModelSerializer):
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
     tasks = TaskSerializer(many=True)
+    count_task = serializers.IntegerField(source="task_count", read_only=True)
+    max_scores = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = models.Exam
@@ -201,64 +253,86 @@ class ExamSerializer(serializers.ModelSerializer):
                   "description",
                   "publish_time",
                   "edit_time",
-                  "tasks",)
+                  "tasks",
+                  "count_task",
+                  "max_scores",)
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], "tasks__answers")
         representation = super().to_representation(instance)
-        representation["count_task"] = instance.tasks.count()
         representation["publish_time"] = instance.publish_time.timestamp()
         representation["edit_time"] = instance.edit_time.timestamp()
-        max_scores = 0
-        for task in instance.tasks.all():
-            max_scores += task.scores
-        representation["max_scores"] = max_scores
         return representation
 
+    def validate_tasks(self, tasks):
+        """
+        При частичном обновлении поля можно не передавать только у существующих
+        заданий и ответов, сопоставленных по id так же, как в bulk.sync_tasks
+        """
+        if not self.partial or self.instance is None:
+            return tasks
+        existing = {}
+        for task_id, answer_id in self.instance.tasks.values_list("pk", "answers__pk"):
+            answers = existing.setdefault(task_id, set())
+            if answer_id is not None:
+                answers.add(answer_id)
+        kept_tasks = set()
+        kept_answers = set()
+        incomplete = False
+        for task in tasks:
+            answers = set()
+            if task.get("id") in existing and task["id"] not in kept_tasks:
+                kept_tasks.add(task["id"])
+                answers = existing[task["id"]]
+            elif any(field not in task for field in ("question", "scores", "answers")):
+                incomplete = True
+            for answer in task.get("answers", []):
+                if answer.get("id") in answers and answer["id"] not in kept_answers:
+                    kept_answers.add(answer["id"])
+                elif any(field not in answer for field in ("text", "is_correct")):
+                    incomplete = True
+        if incomplete:
+            raise serializers.ValidationError("У новых заданий и ответов нужно указать все поля")
+        return tasks
+
     def create(self, validated_data):
         tasks = validated_data.pop("tasks")
-        exam = models.Exam.objects.create(**validated_data)
-        for task in tasks:
-            answers = task.pop("answers")
-            elem = models.Task.objects.create(exam=exam, **task)
-            for answer in answers:
-                models.Answer.objects.create(task=elem, **answer)
+        validated_data["task_count"] = len(tasks)
+        validated_data["max_scores"] = sum(task["scores"] for task in tasks)
+        with transaction.atomic():
+            exam = models.Exam.objects.create(**validated_data)
+            bulk.create_tasks([(exam, tasks)])
+            search.index_exams([exam.pk])
         return exam
 
     def update(self, instance, validated_data):
-        tasks_data = validated_data.pop("tasks")
-        tasks = list(instance.tasks.all())
-        instance.title = validated_data.get("title", instance.title)
-        instance.classroom = validated_data.get("classroom", instance.classroom)
-        instance.subject = validated_data.get("subject", instance.subject)
-        instance.description = validated_data.get("description", instance.description)
-        instance.save()
-        for task_data in tasks_data:
-            answers_data = task_data.pop("answers")
-            task_id = task_data.get("id", None)
-            if task_id:
-                task = tasks.pop(0)
-                answers = task.answers.all()
-                answers = list(answers)
-                task.question = task_data.get("question", task.question)
-                task.scores = task_data.get("scores", task.scores)
-                task.save()
-
-                for answer_data in answers_data:
-                    answer_id = answer_data.get("id", None)
-                    if answer_id:
-                        answer = answers.pop(0)
-                        answer.text = answer_data.get("text", answer.text)
-                        answer.is_correct = answer_data.get("is_correct", answer.is_correct)
-                        answer.save()
-                    else:
-                        models.Answer.objects.create(task=task, **answer_data)
-            else:
-                new_task = models.Task.objects.create(exam=instance, **task_data)
-                for answer_data in answers_data:
-                    models.Answer.objects.create(task=new_task, **answer_data)
+        tasks_data = validated_data.pop("tasks", None)
+        update_fields = [field for field in ("title", "classroom", "subject", "description")
+                         if field in validated_data and getattr(instance, field) != validated_data[field]]
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        with transaction.atomic():
+            if tasks_data is not None and bulk.sync_tasks(instance, tasks_data):
+                update_fields += ["task_count", "max_scores"]
+            if update_fields:
+                instance.save(update_fields=update_fields + ["edit_time"])
         return instance
 
 
+class ExamImportSerializer(serializers.ModelSerializer):
+    """Проверка контрольной из файла переноса, см. api.transfer"""
+    tasks = TaskSerializer(many=True)
+
+    class Meta:
+        model = models.Exam
+        fields = ("title",
+                  "classroom",
+                  "subject",
+                  "description",
+                  "is_show",
+                  "tasks")
+
+
 class ExamMinimalSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -271,7 +345,13 @@ class ErrorSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.ErrorStatistics
-        fields = ("id", "question")
+        fields = ("id", "task", "answer", "question")
+        read_only_fields = ("task", "answer")
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation["question"] = instance.question_text
+        return representation
 
 
 class StatisticsReadSerializer(serializers.ModelSerializer):
@@ -297,6 +377,7 @@ class StatisticsReadSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         instance.grade = validated_data.get("grade", instance.grade)
+        instance.is_graded = True
         instance.save()
         return instance
 
@@ -321,9 +402,10 @@ class StatisticsPutSerializer(serializers.ModelSerializer):
                   "start_time",
                   "end_time",
                   "errors")
+        # Оценку выставляет только сервер, см. StatisticsViewSet.submit
+        read_only_fields = ("grade",)
 
     def update(self, instance, validated_data):
-        instance.grade = validated_data.get("grade", instance.grade)
         errors = validated_data.get("errors")
         for error in errors:
             models.ErrorStatistics.objects.create(statistics=instance, **error)
@@ -337,11 +419,69 @@ class StatisticsPutSerializer(serializers.ModelSerializer):
         return representation
 
 
+class SelectedAnswersSerializer(serializers.Serializer):
+    task = serializers.IntegerField()
+    answers = serializers.ListField(child=serializers.IntegerField(), allow_empty=True)
+
+
+class StudentExamSummarySerializer(serializers.ModelSerializer):
+    exam = ExamMinimalSerializer(read_only=True)
+    mean_grade = serializers.FloatField(read_only=True)
+    max_scores = serializers.IntegerField(source="exam.max_scores", read_only=True)
+
+    class Meta:
+        model = models.StudentExamSummary
+        fields = ("exam",
+                  "attempts",
+                  "best_grade",
+                  "last_grade",
+                  "mean_grade",
+                  "max_scores",
+                  "last_time")
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation["last_time"] = instance.last_time.timestamp() if instance.last_time else None
+        return representation
+
+
+class StudentSubjectSummarySerializer(serializers.ModelSerializer):
+    mean_percent = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = models.StudentSubjectSummary
+        fields = ("subject",
+                  "attempts",
+                  "best_percent",
+                  "last_percent",
+                  "mean_percent",
+                  "last_time")
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation["last_time"] = instance.last_time.timestamp() if instance.last_time else None
+        return representation
+
+
+class StudentSummarySerializer(serializers.Serializer):
+    """Итоги текущего ученика по предметам и контрольным"""
+    subjects = StudentSubjectSummarySerializer(many=True)
+    exams = StudentExamSummarySerializer(many=True)
+
+
+class StatisticsSubmitSerializer(serializers.Serializer):
+    """Выбранные учеником ответы для проверки на сервере"""
+    answers = SelectedAnswersSerializer(many=True)
+
+    def get_selections(self):
+        return {item["task"]: frozenset(item["answers"]) for item in self.validated_data["answers"]}
+
+
 class StatisticsPostSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     errors = serializers.SlugRelatedField(many=True,
                                           read_only=True,
-                                          slug_field="question")
+                                          slug_field="question_text")
 
     class Meta:
         model = models.Statistics
@@ -353,6 +493,7 @@ class StatisticsPostSerializer(serializers.ModelSerializer):
                   "start_time",
                   "end_time",
                   "errors")
+        read_only_fields = ("grade",)
 
     def create(self, validated_data):
         validated_data["grade"] = 0
@@ -391,6 +532,36 @@ class ExamReadItemStatistics(serializers.ModelSerializer):
         representation["end_time"] = instance.end_time.timestamp()
         return representation
 
+
+class GradeCountSerializer(serializers.Serializer):
+    grade = serializers.IntegerField()
+    count = serializers.IntegerField()
+
+
+class QuestionErrorsSerializer(serializers.Serializer):
+    task = serializers.IntegerField(allow_null=True)
+    question = serializers.CharField()
+    errors = serializers.IntegerField()
+    rate = serializers.FloatField()
+
+
+class HardestQuestionsSerializer(serializers.Serializer):
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class ExamSummarySerializer(serializers.Serializer):
+    """Сводная статистика контрольной, см. analytics.exam_summary"""
+    attempts = serializers.IntegerField()
+    max_scores = serializers.IntegerField()
+    mean = serializers.FloatField(allow_null=True)
+    median = serializers.FloatField(allow_null=True)
+    min = serializers.IntegerField(allow_null=True)
+    max = serializers.IntegerField(allow_null=True)
+    percentiles = serializers.DictField(child=serializers.FloatField(allow_null=True))
+    histogram = GradeCountSerializer(many=True)
+    questions = QuestionErrorsSerializer(many=True)
+
+
 class ExamStatisticsSerializer(serializers.ModelSerializer):
     statistics = ExamReadItemStatistics(read_only=True, many=True)
 
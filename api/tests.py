@@ -1,8 +1,22 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
+from io import BytesIO, StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import NotSupportedError, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 import rest_framework_simplejwt
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import CustomUser
+from . import authentication, benchmark, budgets, bulk, cache, catalogue, grading, metrics, progress, seed, transfer, views
+from .models import Comment, CustomUser, ErrorStatistics, Exam, Statistics, StudentExamSummary, StudentSubjectSummary, Task
 from rest_framework.authtoken.models import Token
 
 
@@ -37,7 +51,90 @@ def get_exam():
         }
 
 
-class AccountTest(APITestCase):
+def create_exams(count, start=0):
+    """Создает контрольные, у каждой из которых свой автор"""
+    for index in range(start, start + count):
+        author = CustomUser.objects.create_user("teacher{}@m.com".format(index),
+                                                "123123123df",
+                                                first_name="Teacher",
+                                                last_name=str(index),
+                                                is_teacher=True)
+        Exam.objects.create(author=author,
+                            title="Exam {}".format(index),
+                            classroom=11,
+                            subject="al",
+                            description="Описание")
+
+
+class LocalCacheMixin:
+    """Отдельный кэш в памяти на каждый тест вместо кэша проекта из настроек"""
+
+    def setUp(self):
+        super().setUp()
+        caches = override_settings(CACHES={"default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": self.id(),
+        }})
+        caches.enable()
+        self.addCleanup(caches.disable)
+
+
+class BulkInsertTest(TestCase):
+
+    def test_read_back_only_on_sqlite(self):
+        with transaction.atomic():
+            users = bulk.bulk_insert(CustomUser, [CustomUser(email="bulk{}@example.com".format(index),
+                                                             is_teacher=False) for index in range(3)])
+        self.assertEqual([user.email for user in CustomUser.objects.filter(pk__in=[user.pk for user in users])
+                          .order_by("pk")], ["bulk0@example.com", "bulk1@example.com", "bulk2@example.com"])
+
+        with mock.patch.object(connection, "vendor", "mysql"), transaction.atomic():
+            with self.assertRaises(NotSupportedError):
+                bulk.bulk_insert(CustomUser, [CustomUser(email="bulk3@example.com", is_teacher=False)])
+        self.assertFalse(CustomUser.objects.filter(email="bulk3@example.com").exists())
+
+
+class CacheTest(LocalCacheMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.reset_stats()
+
+    def test_versioned_keys(self):
+        self.assertIsNone(cache.get("exams", 1))
+        self.assertEqual(cache.get_or_set("exams", 1, default=lambda: "value"), "value")
+        self.assertEqual(cache.get_or_set("exams", 1, default=lambda: "other"), "value")
+        cache.put("comments", 1, value="comment")
+        cache.bump("exams")
+        self.assertIsNone(cache.get("exams", 1))
+        self.assertEqual(cache.get("comments", 1), "comment")
+        self.assertEqual(cache.stats()["exams"], {"hits": 1, "misses": 3})
+        self.assertEqual(cache.stats()["comments"], {"hits": 1, "misses": 0})
+
+
+class QueryBudgetTest(LocalCacheMixin, TestCase):
+    # Второй набор данных: больше контрольных, чем на странице, и больше попыток на контрольную
+    SCALES = ((0.15, None), (0.3, {"attempts": 2400}))
+
+    def test_query_budgets(self):
+        runs = []
+        for scale, volumes in self.SCALES:
+            seed.seed(scale, volumes=volumes)
+            runs.append(benchmark.run(repeat=1))
+            seed.clear()
+        self.assertEqual(budgets.check(runs), [])
+
+    def test_check(self):
+        def run(queries):
+            return {"results": {"ExamViewSet.list GET": {"cold_queries": queries, "queries": queries}}}
+
+        self.assertEqual(budgets.check([run(2), run(2)]), [])
+        self.assertEqual(len(budgets.check([run(1), run(2)])), 1)
+        self.assertEqual(len(budgets.check([run(2)], {"ExamViewSet.list GET": 1})), 1)
+        self.assertEqual(len(budgets.check([run(1)], {})), 1)
+
+
+class AccountTest(LocalCacheMixin, APITestCase):
 
     def test_create_account(self):
         data = {
@@ -66,9 +163,10 @@ class AccountTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
-class MainTest(APITestCase):
+class MainTest(LocalCacheMixin, APITestCase):
 
     def setUp(self):
+        super().setUp()
         self.first_name = "Vasiliy"
         self.last_name = "Mironov"
         self.email = "v@m.com"
@@ -81,6 +179,9 @@ class MainTest(APITestCase):
         token = Token.objects.create(user=self.user)
         self.client.credentials(HTTP_AUTHORIZATION="Token " + str(token.key))
         self.avatar = 'R0lGODlhAQABAIAAAP///////yH5BAEKAAEALAAAAAABAAEAAAICTAEAOw=='
+        grading.answer_keys.clear()
+        grading.answer_keys.hits = grading.answer_keys.misses = 0
+        metrics.registry.reset()
 
     def test_get_me(self):
         response = self.client.get("/api/v1/auth/users/me/")
@@ -103,6 +204,81 @@ class MainTest(APITestCase):
         self.assertEqual(data["last_name"], "Mironov1")
         self.assertEqual(data["is_teacher"], True)
 
+    def test_basic_auth_cache(self):
+        self.client.credentials(HTTP_AUTHORIZATION=self.basic_auth(self.password))
+        for _ in range(2):
+            response = self.client.get("/api/v1/auth/users/me/")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cache.stats()["auth-basic"], {"hits": 1, "misses": 1})
+
+        self.client.credentials(HTTP_AUTHORIZATION=self.basic_auth("wrong"))
+        self.assertEqual(self.client.get("/api/v1/auth/users/me/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.set_password("new-password-1")
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=self.basic_auth(self.password))
+        self.assertEqual(self.client.get("/api/v1/auth/users/me/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def basic_auth(self, password):
+        return "Basic " + base64.b64encode("{}:{}".format(self.email, password).encode()).decode()
+
+    def test_user_write_queries(self):
+        self.client.credentials()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post("/api/v1/auth/token/login/", {"email": self.email, "password": self.password})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # пользователь, токен и UPDATE last_login, профиль не читается и не сохраняется
+        self.assertEqual(len(context), 3)
+        self.assertFalse(any('"api_profile"' in query["sql"] for query in context.captured_queries))
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + response.data["auth_token"])
+        self.client.get("/api/v1/auth/users/me/")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put("/api/v1/auth/users/me/", {"last_name": "Petrov"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # UPDATE пользователя, сброс кэша токена, проверка кэша каталога (автор или комментатор) и чтение аватарки для ответа
+        self.assertEqual(len(context), 4)
+        self.assertFalse(any(query["sql"].startswith('UPDATE "api_profile"') for query in context.captured_queries))
+
+    def test_token_auth_cache(self):
+        self.client.get("/api/v1/auth/users/me/")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/v1/auth/users/me/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('"authtoken_token"' in query["sql"] for query in context.captured_queries))
+        # хэш пароля в кэш не попадает
+        _, values = cache.get(authentication.TOKEN_NAMESPACE, authentication.token_key(Token.objects.get(user=self.user).key))
+        self.assertNotIn("password", values)
+
+        # изменение пользователя сбрасывает кэш после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put("/api/v1/auth/users/me/", {"last_name": "Petrov"})
+        self.assertEqual(self.client.get("/api/v1/auth/users/me/").data["last_name"], "Petrov")
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(self.password))
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get("/api/v1/auth/users/me/").status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.is_active = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/v1/auth/token/logout/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get("/api/v1/auth/users/me/").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_jwt(self):
+        self.client.credentials()
+        response = self.client.post("/api/v1/auth/jwt/create/", {"email": self.email, "password": self.password})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        response = self.client.get("/api/v1/auth/users/me/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["email"], self.email)
+
     def test_update_avatar(self):
         data = {
             "avatar": self.avatar
@@ -115,7 +291,270 @@ class MainTest(APITestCase):
     def test_list_exam(self):
         response = self.client.get("/api/v1/exams/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)
+        self.assertEqual(len(response.data["results"]), 0)
+
+    def test_list_exam_summary(self):
+        response = self.client.post("/api/v1/exams-detail/", get_exam(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["count_task"], 2)
+        self.assertEqual(response.data["max_scores"], 20)
+        response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["results"][0]
+        self.assertEqual(data["count_task"], 2)
+        self.assertEqual(data["max_scores"], 20)
+
+    def test_exam_summary_consistency(self):
+        response = self.client.post("/api/v1/exams-detail/", get_exam(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        exam_id = response.data["id"]
+        task = response.data["tasks"][0]
+        response = self.client.delete("/api/v1/answers/{}/".format(task["answers"][0]["id"]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Task.objects.get(pk=task["id"]).correct_count, 0)
+        response = self.client.delete("/api/v1/tasks/{}/".format(task["id"]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        exam = Exam.objects.get(pk=exam_id)
+        self.assertEqual(exam.task_count, 1)
+        self.assertEqual(exam.max_scores, 10)
+        call_command("rebuild_exam_summary", "--check", stdout=StringIO())
+
+        Exam.objects.update(task_count=0, max_scores=0)
+        Task.objects.update(correct_count=5)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_exam_summary", "--check", stdout=StringIO())
+        call_command("rebuild_exam_summary", stdout=StringIO())
+        exam.refresh_from_db()
+        self.assertEqual(exam.task_count, 1)
+        self.assertEqual(exam.max_scores, 10)
+        self.assertEqual(Task.objects.get().correct_count, 1)
+
+    def test_retrieve_exam_with_tasks_query_count(self):
+        data = get_exam()
+        response = self.client.post("/api/v1/exams-detail/", data, format="json")
+        small_id = response.data["id"]
+        data["tasks"] = data["tasks"] * 10
+        response = self.client.post("/api/v1/exams-detail/", data, format="json")
+        large_id = response.data["id"]
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get("/api/v1/exams-detail/{}/".format(small_id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get("/api/v1/exams-detail/{}/".format(large_id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["tasks"]), 20)
+        self.assertEqual(len(small), len(large))
+
+    def test_update_exam_by_id(self):
+        response = self.client.post("/api/v1/exams-detail/", get_exam(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.data
+        url = "/api/v1/exams-detail/{}/".format(data["id"])
+        first, second = data["tasks"]
+        # меняем порядок, удаляем ответ первого задания и добавляем новое задание
+        first["answers"] = [{"text": "new", "is_correct": True}, {"text": "new1", "is_correct": True}]
+        second["question"] = "Изменено"
+        new = {"question": "Новое", "scores": 5, "answers": [{"text": "a", "is_correct": True}]}
+        data["tasks"] = [second, first, new]
+        response = self.client.put(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tasks = {task["id"]: task for task in response.data["tasks"]}
+        self.assertEqual(tasks[second["id"]]["question"], "Изменено")
+        self.assertEqual(tasks[first["id"]]["question"], "Вопрос?")
+        self.assertEqual([answer["text"] for answer in tasks[first["id"]]["answers"]], ["new", "new1"])
+        self.assertTrue(tasks[first["id"]]["many_option"])
+        self.assertEqual(response.data["count_task"], 3)
+        self.assertEqual(response.data["max_scores"], 25)
+
+        # удаление задания
+        data = response.data
+        data["tasks"] = [task for task in data["tasks"] if task["id"] != second["id"]]
+        response = self.client.put(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count_task"], 2)
+        self.assertFalse(Task.objects.filter(pk=second["id"]).exists())
+
+        # повторное сохранение без изменений ничего не пишет
+        edit_time = response.data["edit_time"]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(url, response.data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["edit_time"], edit_time)
+        writes = [query["sql"] for query in context.captured_queries
+                  if query["sql"].startswith(("UPDATE", "INSERT", "DELETE"))]
+        self.assertEqual(writes, [])
+
+    def test_partial_update_exam_tasks(self):
+        exam = get_exam()
+        exam["tasks"][0]["answers"].append({"text": "wrong", "is_correct": False})
+        data = self.client.post("/api/v1/exams-detail/", exam, format="json").data
+        url = "/api/v1/exams-detail/{}/".format(data["id"])
+        first, second = data["tasks"]
+        right, wrong = first["answers"]
+        # у существующих заданий и ответов достаточно id и изменившихся полей
+        response = self.client.patch(url, {"tasks": [
+            {"id": first["id"], "answers": [{"id": right["id"]}, {"id": wrong["id"], "is_correct": True}]},
+            {"id": second["id"], "scores": 3},
+        ]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tasks = {task["id"]: task for task in response.data["tasks"]}
+        self.assertEqual([(answer["text"], answer["is_correct"]) for answer in tasks[first["id"]]["answers"]],
+                         [("text", True), ("wrong", True)])
+        self.assertTrue(tasks[first["id"]]["many_option"])
+        self.assertEqual((tasks[second["id"]]["question"], len(tasks[second["id"]]["answers"])), ("Вопрос?", 1))
+        self.assertEqual(response.data["max_scores"], 13)
+
+        # новые задания и ответы задаются полностью
+        response = self.client.patch(url, {"tasks": [
+            {"id": first["id"], "answers": [{"text": "new"}]},
+        ]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url, {"tasks": [{"question": "Новое"}]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Task.objects.filter(exam_id=data["id"]).count(), 2)
+
+    def test_list_exam_filters(self):
+        create_exams(3)
+        Exam.objects.filter(title="Exam 1").update(subject="ph", classroom=9)
+        first = Exam.objects.get(title="Exam 0")
+        response = self.client.get("/api/v1/exams/", {"subject": "ph"})
+        self.assertEqual([exam["title"] for exam in response.data["results"]], ["Exam 1"])
+        response = self.client.get("/api/v1/exams/", {"subject": "al", "classroom": 11})
+        self.assertEqual([exam["title"] for exam in response.data["results"]], ["Exam 2", "Exam 0"])
+        response = self.client.get("/api/v1/exams/", {"author": first.author_id})
+        self.assertEqual([exam["title"] for exam in response.data["results"]], ["Exam 0"])
+        response = self.client.get("/api/v1/exams/", {"published_before": first.publish_time.timestamp() + 0.000001})
+        self.assertEqual([exam["title"] for exam in response.data["results"]], ["Exam 0"])
+        response = self.client.get("/api/v1/exams/", {"published_after": first.publish_time.timestamp() + 0.000001})
+        self.assertEqual([exam["title"] for exam in response.data["results"]], ["Exam 2", "Exam 1"])
+        response = self.client.get("/api/v1/exams/", {"subject": "xx"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for value in ("1e20", "-1e12", "nan", "inf", "-inf"):
+            for field in ("published_after", "published_before"):
+                response = self.client.get("/api/v1/exams/", {field: value})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, (field, value))
+
+    def test_search_exams(self):
+        for backend in ("fts5", "table"):
+            with self.subTest(backend=backend), override_settings(EXAM_SEARCH_BACKEND=backend):
+                algebra = get_exam()
+                algebra["title"] = "Квадратные уравнения"
+                algebra["tasks"][0]["question"] = "Решите уравнение"
+                history = get_exam()
+                history["title"] = "История России"
+                history["tasks"][0]["question"] = "Когда началась Северная война?"
+                algebra = self.client.post("/api/v1/exams-detail/", algebra, format="json").data
+                history = self.client.post("/api/v1/exams-detail/", history, format="json").data
+
+                response = self.client.get("/api/v1/exams/search/", {"q": "квадратное уравнение"})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual([exam["id"] for exam in response.data["results"]], [algebra["id"]])
+                response = self.client.get("/api/v1/exams/search/", {"q": "войны"})
+                self.assertEqual([exam["id"] for exam in response.data["results"]], [history["id"]])
+                # совпадение в теме важнее совпадения в вопросе
+                response = self.client.get("/api/v1/exams/search/", {"q": "уравнения"})
+                self.assertEqual([exam["id"] for exam in response.data["results"]], [algebra["id"]])
+
+                history["title"] = "Уравнения истории"
+                self.client.put("/api/v1/exams-detail/{}/".format(history["id"]), history, format="json")
+                response = self.client.get("/api/v1/exams/search/", {"q": "уравнения"})
+                self.assertCountEqual([exam["id"] for exam in response.data["results"]], [history["id"], algebra["id"]])
+
+                Exam.objects.get(pk=algebra["id"]).delete()
+                Exam.objects.filter(pk=history["id"]).update(is_show=False)
+                response = self.client.get("/api/v1/exams/search/", {"q": "уравнения"})
+                self.assertEqual(response.data["results"], [])
+                Exam.objects.all().delete()
+        response = self.client.get("/api/v1/exams/search/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_exam_pagination(self):
+        create_exams(5)
+        response = self.client.get("/api/v1/exams/", {"page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = [exam["title"] for exam in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            titles += [exam["title"] for exam in response.data["results"]]
+        self.assertEqual(titles, ["Exam {}".format(index) for index in reversed(range(5))])
+
+    def test_list_exam_query_count(self):
+        create_exams(2)
+        # токен попадает в кэш при первом запросе
+        self.client.get("/api/v1/auth/users/me/")
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_exams(10, start=2)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 12)
+        self.assertEqual(len(small), len(large))
+
+    def test_list_exam_cache(self):
+        create_exams(2)
+        response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertFalse(any('"api_profile"' in query["sql"] for query in context.captured_queries))
+
+        # новая контрольная, кэш сбрасывается после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post("/api/v1/exams-detail/", get_exam(), format="json")
+            exam_id = response.data["id"]
+            self.assertEqual(self.client.get("/api/v1/exams/")["X-Cache"], "HIT")
+        self.assertTrue(callbacks)
+        response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["results"]), 3)
+
+        # скрытая контрольная
+        with self.captureOnCommitCallbacks(execute=True):
+            Exam.objects.get(pk=exam_id).save()
+        self.assertEqual(self.client.get("/api/v1/exams/")["X-Cache"], "MISS")
+        exam = Exam.objects.get(pk=exam_id)
+        exam.is_show = False
+        with self.captureOnCommitCallbacks(execute=True):
+            exam.save()
+        response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["results"]), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            exam.save()
+        self.assertEqual(self.client.get("/api/v1/exams/")["X-Cache"], "HIT")
+
+        # аватарка автора
+        exam.is_show = True
+        with self.captureOnCommitCallbacks(execute=True):
+            exam.save()
+        self.client.get("/api/v1/exams/")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put("/api/v1/profiles/{}/".format(self.user.profile.pk), {"avatar": self.avatar})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIsNotNone(response.json()["results"][0]["author"]["avatar"])
+        self.assertEqual(cache.stats()[catalogue.NAMESPACE]["hits"], 3)
+
+        # сброс между чтением контрольных и рендером: ответ не сохраняется под новой версией
+        paginate_queryset = views.ExamViewSet.paginate_queryset
+
+        def paginate_and_invalidate(view, queryset):
+            page = paginate_queryset(view, queryset)
+            catalogue.invalidate()
+            return page
+
+        catalogue.invalidate()
+        with mock.patch.object(views.ExamViewSet, "paginate_queryset", paginate_and_invalidate):
+            self.assertEqual(self.client.get("/api/v1/exams/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/v1/exams/")["X-Cache"], "MISS")
 
     def test_create_edit_exam(self):
         data = get_exam()
@@ -224,13 +663,453 @@ class MainTest(APITestCase):
         # list statistics
         response = self.client.get("/api/v1/statistics/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        data = response.data[0]
+        data = response.data["results"][0]
         self.assertEqual(data["total"], max_scores)
         self.assertEqual(data["grade"], max_scores-2)
         self.assertEqual(data["id"], 1)
         self.assertEqual(data["exam"]["id"], id_exam)
         self.assertEqual(data["errors"][0], "1")
 
+    def test_exam_statistics_summary(self):
+        exam = Exam.objects.create(author=self.user, title="Exam", classroom=11, subject="al", description="Описание")
+        url = "/api/v1/exams-statistics/{}/".format(exam.pk)
+        response = self.client.get(url + "summary/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["attempts"], 0)
+        self.assertIsNone(response.data["median"])
+
+        for index, grade in enumerate([20, 0, 10, 5, 10]):
+            student = CustomUser.objects.create_user("student{}@m.com".format(index), "123123123df", is_teacher=False)
+            statistics = Statistics.objects.create(user=student, exam=exam, grade=grade, total=20, is_graded=True)
+            ErrorStatistics.objects.bulk_create(ErrorStatistics(statistics=statistics, question=question)
+                                                for question in ["Первый", "Второй"][:index % 3])
+        # незавершенная попытка не учитывается
+        unfinished = Statistics.objects.create(user=self.user, exam=exam, grade=0, total=0)
+        ErrorStatistics.objects.create(statistics=unfinished, question="Первый")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url + "summary/")
+        data = response.data
+        self.assertEqual(data["attempts"], 5)
+        self.assertEqual(data["mean"], 9)
+        self.assertEqual(data["median"], 10)
+        self.assertEqual(data["percentiles"]["25"], 5)
+        self.assertEqual(data["percentiles"]["90"], 16)
+        self.assertEqual((data["min"], data["max"]), (0, 20))
+        self.assertEqual([(item["grade"], item["count"]) for item in data["histogram"]],
+                         [(0, 1), (5, 1), (10, 2), (20, 1)])
+        self.assertEqual([(item["question"], item["errors"], item["rate"]) for item in data["questions"]],
+                         [("Первый", 3, 0.6), ("Второй", 1, 0.2)])
+        summary_queries = len(context)
+
+        response = self.client.get(url + "hardest/")
+        self.assertEqual([(item["question"], item["errors"], item["rate"]) for item in response.data],
+                         [("Первый", 3, 0.6), ("Второй", 1, 0.2)])
+
+        Statistics.objects.bulk_create(Statistics(user=self.user, exam=exam, grade=index, total=20, is_graded=True)
+                                       for index in range(20))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url + "summary/")
+        self.assertEqual(response.data["attempts"], 25)
+        self.assertEqual(len(context), summary_queries)
+
+        response = self.client.get(url + "attempts/", {"page_size": 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 10)
+        self.assertIsNotNone(response.data["next"])
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        Statistics.objects.bulk_create(Statistics(user=self.user, exam=exam, grade=index, total=20)
+                                       for index in range(20))
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data["statistics"]), 46)
+        self.assertEqual(len(small), len(large))
+
+        # результаты доступны только автору контрольной
+        self.client.force_authenticate(CustomUser.objects.get(email="student0@m.com"))
+        for action in ("summary", "hardest", "attempts", "export"):
+            response = self.client.get("{}{}/".format(url, action))
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_submit_exam(self):
+        data = get_exam()
+        data["tasks"][1]["answers"].append({"text": "wrong", "is_correct": False})
+        response = self.client.post("/api/v1/exams-detail/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        exam = response.data
+        response = self.client.post("/api/v1/statistics/", {"exam": exam["id"], "grade": 0, "total": 0})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = "/api/v1/statistics/{}/submit/".format(response.data["id"])
+        first, second = exam["tasks"]
+        data = {
+            "answers": [
+                {"task": first["id"], "answers": [first["answers"][0]["id"]]},
+                {"task": second["id"], "answers": [answer["id"] for answer in second["answers"]]},
+            ]
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["grade"], 10)
+        self.assertEqual(response.data["total"], 20)
+        self.assertEqual([error["question"] for error in response.data["errors"]], [second["question"]])
+        self.assertEqual([(error["task"], error["answer"]) for error in response.data["errors"]],
+                         [(second["id"], second["answers"][1]["id"])])
+        inserts = [query for query in context.captured_queries
+                   if query["sql"].startswith('INSERT INTO "api_errorstatistics"')]
+        self.assertEqual(len(inserts), 1)
+
+        # повторная отправка отклоняется и не меняет оценку
+        statistics = Statistics.objects.get(pk=url.split("/")[-3])
+        data["answers"][1]["answers"] = [second["answers"][0]["id"]]
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        statistics.refresh_from_db()
+        self.assertEqual((statistics.grade, statistics.errors.count()), (10, 1))
+
+        # оценку выставляет только сервер
+        statistics_url = "/api/v1/statistics/{}/".format(statistics.pk)
+        self.client.put(statistics_url, {"exam": exam["id"], "grade": 20, "total": 20, "errors": []}, format="json")
+        self.client.patch(statistics_url, {"grade": 20}, format="json")
+        statistics.refresh_from_db()
+        self.assertEqual(statistics.grade, 10)
+
+        # частота отправки ограничена
+        with override_settings(EXAM_SUBMIT_RATE="3/min"):
+            self.assertEqual(self.client.post(url, data, format="json").status_code, status.HTTP_409_CONFLICT)
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_edit_exam_keeps_error_question(self):
+        data = get_exam()
+        data["tasks"][1]["question"] = "Второй?"
+        data["tasks"].append(dict(data["tasks"][0], question="Третий?"))
+        for task in data["tasks"]:
+            task["answers"] = [{"text": "right", "is_correct": True}, {"text": "wrong", "is_correct": False}]
+        exam = self.client.post("/api/v1/exams-detail/", data, format="json").data
+        statistics = self.client.post("/api/v1/statistics/", {"exam": exam["id"], "grade": 0, "total": 0}).data
+        response = self.client.post("/api/v1/statistics/{}/submit/".format(statistics["id"]), {
+            "answers": [{"task": task["id"], "answers": [task["answers"][1]["id"]]} for task in exam["tasks"]],
+        }, format="json")
+        self.assertEqual(len(response.data["errors"]), 3)
+
+        # удаление задания при редактировании контрольной
+        exam["tasks"] = exam["tasks"][:2]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put("/api/v1/exams-detail/{}/".format(exam["id"]), exam, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [query for query in context.captured_queries
+                   if query["sql"].startswith('UPDATE "api_errorstatistics" SET "question"')]
+        self.assertEqual(len(updates), 1)
+        errors = ErrorStatistics.objects.filter(statistics_id=statistics["id"]).order_by("pk")
+        self.assertEqual([(error.task_id, error.question_text) for error in errors],
+                         [(exam["tasks"][0]["id"], "Вопрос?"), (exam["tasks"][1]["id"], "Второй?"),
+                          (None, "Третий?")])
+
+    def test_export_exam_results(self):
+        exam = self.client.post("/api/v1/exams-detail/", get_exam(), format="json").data
+        task = exam["tasks"][0]
+        for index in range(3):
+            student = CustomUser.objects.create_user("student{}@m.com".format(index), "123123123df", is_teacher=False)
+            statistics = Statistics.objects.create(user=student, exam_id=exam["id"], grade=index, total=20)
+            ErrorStatistics.objects.bulk_create(ErrorStatistics(statistics=statistics, task_id=task["id"])
+                                                for _ in range(index))
+        url = "/api/v1/exams-statistics/{}/export/".format(exam["id"])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {"format": "csv"})
+            self.assertTrue(response.streaming)
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual([(row["email"], row["grade"], row["errors"]) for row in rows],
+                         [("student2@m.com", "2", "2"), ("student1@m.com", "1", "1"), ("student0@m.com", "0", "0")])
+        self.assertEqual(len([query for query in context.captured_queries if '"api_statistics"' in query["sql"]]), 1)
+
+        response = self.client.get(url, {"format": "ndjson"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record["grade"] for record in records], [2, 1, 0])
+
+        # имя ученика не выполняется в табличном редакторе как формула
+        CustomUser.objects.filter(email="student0@m.com").update(first_name='=HYPERLINK("http://x")',
+                                                                 last_name="-1+2")
+        response = self.client.get(url, {"format": "csv"})
+        row = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))[-1]
+        self.assertEqual((row["first_name"], row["last_name"], row["grade"]), ('\'=HYPERLINK("http://x")', "'-1+2", "0"))
+
+        # выгружать может только автор
+        self.client.force_authenticate(CustomUser.objects.get(email="student0@m.com"))
+        response = self.client.get(url, {"format": "csv"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_exam_transfer(self):
+        for subject in ("al", "ph"):
+            data = get_exam()
+            data["subject"] = subject
+            self.client.post("/api/v1/exams-detail/", data, format="json")
+        response = self.client.get("/api/v1/exams-detail/export/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[1])["author"]["email"], self.email)
+        response = self.client.get("/api/v1/exams-detail/export/", {"compress": "gzip"})
+        archive = b"".join(response.streaming_content)
+        self.assertEqual(gzip.decompress(archive).splitlines(), lines)
+
+        teacher = CustomUser.objects.create_user("teacher@m.com", "123123123df", is_teacher=True)
+        self.client.force_authenticate(teacher)
+        response = self.client.generic("POST", "/api/v1/exams-detail/import/", archive,
+                                       content_type="application/gzip")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data["exams"], response.data["tasks"], response.data["failed"]), (2, 4, 0))
+        imported = Exam.objects.filter(author=teacher)
+        self.assertEqual(sorted(imported.values_list("subject", "task_count", "max_scores")),
+                         [("al", 2, 20), ("ph", 2, 20)])
+        self.assertEqual(Task.objects.filter(exam__in=imported, correct_count=1).count(), 4)
+        self.assertEqual(len(self.client.get("/api/v1/exams/search/", {"q": "String"}).data["results"]), 4)
+
+        # ошибки в строках пропускаются, остальное загружается
+        body = b"\n".join([lines[0], b"{broken", lines[1], json.dumps({"title": "No tasks"}).encode()])
+        response = self.client.generic("POST", "/api/v1/exams-detail/import/", body,
+                                       content_type="application/x-ndjson")
+        self.assertEqual((response.data["exams"], response.data["failed"]), (1, 2))
+        self.assertEqual([error["line"] for error in response.data["errors"]], [2, 4])
+
+        # команды: выгрузка всех контрольных и загрузка с авторами по email
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "exams.ndjson.gz")
+            call_command("export_exams", path, stderr=StringIO())
+            Exam.objects.all().delete()
+            output = StringIO()
+            call_command("import_exams", path, stdout=output, stderr=StringIO())
+        self.assertIn("Загружено контрольных: 5", output.getvalue())
+        self.assertEqual(Exam.objects.filter(author=teacher).count(), 3)
+
+        # ограничения длины строки и распакованного размера
+        line = lines[1] + b"\n"
+        with override_settings(EXAM_IMPORT_MAX_LINE=len(line) + 10):
+            bomb = gzip.compress(line + b" " * 10 ** 7)
+            response = self.client.generic("POST", "/api/v1/exams-detail/import/", bomb,
+                                           content_type="application/gzip")
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual((response.data["exams"], response.data["errors"][0]["line"]), (1, 2))
+        with override_settings(EXAM_IMPORT_MAX_SIZE=len(line) * 3):
+            result = transfer.import_exams(BytesIO(gzip.compress(line * 100)), author=teacher)
+        self.assertTrue(result.limit_exceeded)
+        self.assertEqual((result.exams, result.failed), (0, 1))
+
+    def test_hardest_questions(self):
+        response = self.client.post("/api/v1/exams-detail/", get_exam(), format="json")
+        exam = response.data
+        first, second = exam["tasks"]
+        for index in range(4):
+            response = self.client.post("/api/v1/statistics/", {"exam": exam["id"], "grade": 0, "total": 0})
+            answers = [{"task": first["id"], "answers": []}] if index else []
+            self.client.post("/api/v1/statistics/{}/submit/".format(response.data["id"]),
+                             {"answers": answers}, format="json")
+        url = "/api/v1/exams-statistics/{}/hardest/".format(exam["id"])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(item["task"], item["errors"], item["rate"]) for item in response.data],
+                         [(first["id"], 4, 1.0), (second["id"], 4, 1.0)])
+        grouped = [query["sql"] for query in context.captured_queries if "GROUP BY" in query["sql"]]
+        self.assertIn('GROUP BY "api_errorstatistics"."task_id"', grouped[0])
+        response = self.client.get(url, {"limit": 1})
+        self.assertEqual(len(response.data), 1)
+
+        # после удаления задания ошибки сохраняют текст вопроса
+        self.client.delete("/api/v1/tasks/{}/".format(first["id"]))
+        response = self.client.get(url)
+        self.assertEqual([(item["task"], item["question"]) for item in response.data],
+                         [(second["id"], second["question"]), (None, first["question"])])
+
+    def test_student_summary(self):
+        algebra = self.client.post("/api/v1/exams-detail/", get_exam(), format="json").data
+        geometry = get_exam()
+        geometry["subject"] = "gm"
+        geometry = self.client.post("/api/v1/exams-detail/", geometry, format="json").data
+
+        def attempt(exam, correct):
+            response = self.client.post("/api/v1/statistics/", {"exam": exam["id"], "grade": 0, "total": 0})
+            url = "/api/v1/statistics/{}/submit/".format(response.data["id"])
+            answers = [{"task": task["id"], "answers": [task["answers"][0]["id"]]} for task in exam["tasks"][:correct]]
+            self.client.post(url, {"answers": answers}, format="json")
+            return url
+
+        attempt(algebra, 2)
+        attempt(algebra, 0)
+        url = attempt(algebra, 1)
+        attempt(geometry, 2)
+        response = self.client.get("/api/v1/statistics/summary/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        subjects = {item["subject"]: item for item in response.data["subjects"]}
+        self.assertEqual((subjects["al"]["attempts"], subjects["al"]["best_percent"],
+                          subjects["al"]["last_percent"], subjects["al"]["mean_percent"]), (3, 100, 50, 50))
+        self.assertEqual(subjects["gm"]["mean_percent"], 100)
+        exams = {item["exam"]["id"]: item for item in response.data["exams"]}
+        self.assertEqual((exams[algebra["id"]]["attempts"], exams[algebra["id"]]["best_grade"],
+                          exams[algebra["id"]]["last_grade"], exams[algebra["id"]]["mean_grade"],
+                          exams[algebra["id"]]["max_scores"]), (3, 20, 10, 10, 20))
+
+        # повторная отправка не оценивает попытку заново
+        response = self.client.post(url, {"answers": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        summary = StudentExamSummary.objects.get(user=self.user, exam_id=algebra["id"])
+        self.assertEqual((summary.attempts, summary.grade_sum), (3, 30))
+
+        # изменение оценки пересчитывает итоги, а не добавляет попытку
+        statistics = Statistics.objects.get(pk=url.split("/")[-3])
+        statistics.grade = 0
+        statistics.save()
+        summary = StudentExamSummary.objects.get(user=self.user, exam_id=algebra["id"])
+        self.assertEqual((summary.attempts, summary.best_grade, summary.last_grade, summary.grade_sum), (3, 20, 0, 20))
+        Statistics.objects.filter(grade=20, exam_id=algebra["id"]).delete()
+        summary = StudentExamSummary.objects.get(user=self.user, exam_id=algebra["id"])
+        self.assertEqual((summary.attempts, summary.best_grade), (2, 0))
+
+        rows = lambda: (sorted(StudentExamSummary.objects.values_list("exam", "attempts", "best_grade", "last_grade",
+                                                                     "grade_sum")),
+                        sorted(StudentSubjectSummary.objects.values_list("subject", "attempts", "best_percent",
+                                                                         "last_percent", "percent_sum")))
+        incremental = rows()
+        call_command("rebuild_student_summaries", stdout=StringIO())
+        self.assertEqual(rows(), incremental)
+
+        Exam.objects.get(pk=geometry["id"]).delete()
+        self.assertEqual([item["subject"] for item in self.client.get("/api/v1/statistics/summary/").data["subjects"]],
+                         ["al"])
+
+        # итоги удаляемого пользователя не пересчитываются по каждой попытке
+        student = CustomUser.objects.create_user("student@m.com", "123123123df", is_teacher=False)
+        Statistics.objects.bulk_create(Statistics(user=student, exam_id=algebra["id"], grade=index, total=20,
+                                                  is_graded=True) for index in range(5))
+        progress.rebuild(user_ids=[student.pk])
+        with CaptureQueriesContext(connection) as context:
+            student.delete()
+        self.assertFalse(any("GROUP BY" in query["sql"] for query in context.captured_queries))
+        self.assertFalse(StudentExamSummary.objects.filter(user_id=student.pk).exists())
+
+    def test_request_metrics(self):
+        response = self.client.get("/api/v1/exams/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+        # метрики доступны по токену из настроек или сотрудникам
+        self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer secret")
+        with override_settings(API_METRICS={"TOKEN": "secret"}):
+            response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        text = response.content.decode()
+        self.assertIn('api_requests_total{view="ExamViewSet",action="list",method="GET"} 1', text)
+        self.assertIn('api_n_plus_one_total{view="ExamViewSet",action="list",method="GET"} 0', text)
+        with override_settings(API_METRICS={"TOKEN": "other"}):
+            self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials()
+        self.client.force_login(CustomUser.objects.create_user("staff@m.com", "123123123df", is_teacher=False,
+                                                               is_staff=True))
+        self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_200_OK)
+        self.client.logout()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + Token.objects.get(user=self.user).key)
+
+        response = self.client.post("/api/v1/exams-detail/", get_exam(), format="json")
+        with override_settings(API_METRICS={"MAX_QUERIES_PER_ITEM": 0.1, "MIN_ITEMS": 1}):
+            with self.assertLogs("api.metrics", "WARNING"):
+                self.client.get("/api/v1/exams-detail/{}/".format(response.data["id"]))
+        self.assertIn('api_n_plus_one_total{view="ExamWithTaskViewSet",action="retrieve",method="GET"} 1',
+                      metrics.registry.render())
+
+    def test_seed_and_benchmark(self):
+        counts = seed.seed(scale=0.05)
+        self.assertEqual(counts["exams"], 5)
+        self.assertEqual(Statistics.objects.filter(is_graded=True).count(), counts["statistics"])
+        self.assertEqual(StudentExamSummary.objects.aggregate(total=Sum("attempts"))["total"], counts["statistics"])
+        self.assertTrue(seed.exists())
+
+        exams = Exam.objects.count()
+        results = benchmark.run(repeat=1)
+        self.assertEqual(Exam.objects.count(), exams)
+        self.assertEqual(sorted(results["skipped"]), ["ProfileViewSet.partial_update PATCH",
+                                                      "ProfileViewSet.update PUT"])
+        for key, result in results["results"].items():
+            self.assertLess(result["status"], 400, key)
+        self.assertIn("ExamViewSet.list GET", results["results"])
+        rows = benchmark.compare(results, results)
+        self.assertFalse(any(row[-1] for row in rows))
+
+        seed.clear()
+        self.assertFalse(seed.exists())
+
+    def test_submit_uses_answer_key_cache(self):
+        response = self.client.post("/api/v1/exams-detail/", get_exam(), format="json")
+        exam = response.data
+
+        def attempt_url():
+            response = self.client.post("/api/v1/statistics/", {"exam": exam["id"], "grade": 0, "total": 0})
+            return "/api/v1/statistics/{}/submit/".format(response.data["id"])
+
+        data = {"answers": [{"task": task["id"], "answers": [task["answers"][0]["id"]]} for task in exam["tasks"]]}
+        response = self.client.post(attempt_url(), data, format="json")
+        self.assertEqual(response.data["grade"], 20)
+        url = attempt_url()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.data["grade"], 20)
+        # ошибки читаются вместе с заданиями через JOIN, но сами задания заново не загружаются
+        self.assertFalse(any('FROM "api_task"' in query["sql"] for query in context.captured_queries))
+        self.assertEqual(grading.answer_keys.hits, 1)
+
+        # после редактирования контрольной ключ ответов перечитывается
+        exam["tasks"][0]["answers"][0]["is_correct"] = False
+        response = self.client.put("/api/v1/exams-detail/{}/".format(exam["id"]), exam, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(attempt_url(), data, format="json")
+        self.assertEqual(response.data["grade"], 10)
+        self.assertEqual(grading.answer_keys.misses, 2)
+
+    def test_exam_conditional_get(self):
+        response = self.client.post("/api/v1/exams-detail/", get_exam(), format="json")
+        exam = response.data
+        url = "/api/v1/exams/{}/".format(exam["id"])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        exam_queries = [query for query in context.captured_queries if '"api_exam"' in query["sql"]]
+        self.assertEqual(len(exam_queries), 1)
+
+        # новый комментарий меняет ETag
+        response = self.client.post("/api/v1/comments/", {"text": "text", "exam": exam["id"]})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        # имя комментатора тоже меняет ETag
+        commenter = CustomUser.objects.create_user("commenter@m.com", "123123123df", is_teacher=False)
+        Comment.objects.create(exam_id=exam["id"], author=commenter, text="text")
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            commenter.last_name = "Petrov"
+            commenter.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["comments"][-1]["author"]["last_name"], "Petrov")
+
+        # список и контрольная с заданиями
+        for url in ("/api/v1/exams/", "/api/v1/exams-detail/{}/".format(exam["id"])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get("/api/v1/exams-detail/{}/".format(exam["id"]),
+                                   HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
     def test_comment(self):
         # create exam
         data = get_exam()
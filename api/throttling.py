@@ -0,0 +1,14 @@
+from django.conf import settings
+from rest_framework.throttling import UserRateThrottle
+
+
+class SubmitRateThrottle(UserRateThrottle):
+    """
+    Ограничивает отправку ответов пользователем: ответ с ошибками по заданиям
+    иначе позволяет подобрать верные ответы повторными отправками.
+    Частота - EXAM_SUBMIT_RATE, None отключает ограничение.
+    """
+    scope = "submit"
+
+    def get_rate(self):
+        return getattr(settings, "EXAM_SUBMIT_RATE", "10/min")
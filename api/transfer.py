@@ -0,0 +1,251 @@
+"""
+Перенос контрольных между экземплярами API.
+
+Формат - NDJSON, можно сжатый gzip. Первая строка - заголовок
+{"format": "testing-exams", "version": 1}, дальше по контрольной на строку:
+
+    {"title": ..., "classroom": ..., "subject": ..., "description": ..., "is_show": ...,
+     "author": {"email": ..., "first_name": ..., "last_name": ..., "avatar": ...},
+     "tasks": [{"question": ..., "scores": ..., "answers": [{"text": ..., "is_correct": ...}]}]}
+
+avatar - имя файла в хранилище media: файлы переносятся отдельно, вместе с каталогом media.
+Выгрузка и загрузка идут порциями по batch_size контрольных, поэтому память
+не зависит от размера файла. Длина строки и распакованный размер загрузки
+ограничены EXAM_IMPORT_MAX_LINE и EXAM_IMPORT_MAX_SIZE.
+"""
+import json
+import time
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from . import bulk, catalogue, search
+from .models import Answer, CustomUser, Exam, Task
+from .serializers import ExamImportSerializer
+
+FORMAT = "testing-exams"
+VERSION = 1
+BATCH_SIZE = 500
+READ_SIZE = 64 * 1024
+MAX_ERRORS = 100
+GZIP_MAGIC = b"\x1f\x8b"
+MAX_LINE = 1024 * 1024
+MAX_SIZE = 256 * 1024 * 1024
+
+
+class LimitExceeded(ValueError):
+    """Строка или распакованные данные загрузки больше допустимого"""
+
+
+def export_exams(queryset, batch_size=BATCH_SIZE):
+    """Строки NDJSON для контрольных queryset, по три запроса на batch_size контрольных"""
+    yield json.dumps({"format": FORMAT, "version": VERSION}) + "\n"
+    queryset = queryset.select_related("author__profile").order_by("pk")
+    last_pk = 0
+    while True:
+        exams = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not exams:
+            return
+        last_pk = exams[-1].pk
+        answers = defaultdict(list)
+        for task_id, text, is_correct in Answer.objects.filter(task__exam__in=exams).order_by("pk").values_list(
+                "task_id", "text", "is_correct"):
+            answers[task_id].append({"text": text, "is_correct": is_correct})
+        tasks = defaultdict(list)
+        for pk, exam_id, question, scores in Task.objects.filter(exam__in=exams).order_by("pk").values_list(
+                "pk", "exam_id", "question", "scores"):
+            tasks[exam_id].append({"question": question, "scores": scores, "answers": answers[pk]})
+        for exam in exams:
+            author = exam.author
+            yield json.dumps({
+                "title": exam.title,
+                "classroom": exam.classroom,
+                "subject": exam.subject,
+                "description": exam.description,
+                "is_show": exam.is_show,
+                "author": {"email": author.email, "first_name": author.first_name, "last_name": author.last_name,
+                           "avatar": author.profile.avatar.name or None},
+                "tasks": tasks[exam.pk],
+            }, ensure_ascii=False) + "\n"
+
+
+def gzip_chunks(lines, chunk_size=READ_SIZE):
+    """Сжимает строки в поток gzip, отдавая данные кусками"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    pending = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            chunk = compressor.compress(b"".join(pending))
+            pending, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b"".join(pending)) + compressor.flush()
+
+
+def iter_lines(stream, read_size=READ_SIZE, max_line=None, max_size=None):
+    """
+    Строки (bytes) из файлового объекта, сжатый gzip поток распаковывается на лету
+    порциями не больше read_size. LimitExceeded - строка длиннее max_line
+    или данные больше max_size байт после распаковки.
+    """
+    max_line = max_line or getattr(settings, "EXAM_IMPORT_MAX_LINE", MAX_LINE)
+    max_size = max_size or getattr(settings, "EXAM_IMPORT_MAX_SIZE", MAX_SIZE)
+    chunk = stream.read(len(GZIP_MAGIC))
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32) if chunk == GZIP_MAGIC else None
+    pending = b""
+    size = 0
+    while chunk:
+        while chunk:
+            if decompressor:
+                data = decompressor.decompress(chunk, read_size)
+                chunk = decompressor.unconsumed_tail
+            else:
+                data, chunk = chunk, b""
+            size += len(data)
+            if size > max_size:
+                raise LimitExceeded("Данные больше {} байт".format(max_size))
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                if len(line) > max_line:
+                    raise LimitExceeded("Строка длиннее {} байт".format(max_line))
+                yield line
+            if len(pending) > max_line:
+                raise LimitExceeded("Строка длиннее {} байт".format(max_line))
+        chunk = stream.read(read_size)
+    if decompressor:
+        pending += decompressor.flush()
+        if size + len(pending) > max_size:
+            raise LimitExceeded("Данные больше {} байт".format(max_size))
+    yield from pending.split(b"\n")
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.exams = 0
+        self.tasks = 0
+        self.failed = 0
+        self.errors = []
+        self.limit_exceeded = False
+        self.seconds = 0.0
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    @property
+    def exams_per_second(self):
+        return self.exams / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {"exams": self.exams, "tasks": self.tasks, "failed": self.failed, "errors": self.errors,
+                "seconds": round(self.seconds, 3), "exams_per_second": round(self.exams_per_second, 1)}
+
+
+def import_exams(stream, author=None, create_authors=False, batch_size=BATCH_SIZE):
+    """
+    Загружает контрольные из потока NDJSON или gzip.
+    author - владелец всех контрольных, иначе авторы ищутся по email,
+    а при create_authors отсутствующие создаются без пароля.
+    Каждая порция загружается в своей транзакции: ошибки в строках
+    пропускаются и возвращаются в ImportResult. При превышении
+    EXAM_IMPORT_MAX_LINE или EXAM_IMPORT_MAX_SIZE загрузка останавливается.
+    """
+    result = ImportResult()
+    start = time.perf_counter()
+    # Один экземпляр на весь файл: поля вложенных сериалайзеров строятся один раз
+    validator = ExamImportSerializer()
+    batch = []
+    lines = enumerate(iter_lines(stream), 1)
+    number = 0
+    while True:
+        try:
+            number, line = next(lines)
+        except StopIteration:
+            break
+        except LimitExceeded as error:
+            # Загрузка останавливается, уже прочитанные строки загружаются
+            result.error(number + 1, str(error))
+            result.limit_exceeded = True
+            break
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            document = json.loads(line)
+        except ValueError:
+            result.error(number, "Некорректный JSON")
+            continue
+        if not isinstance(document, dict):
+            result.error(number, "Ожидался объект")
+            continue
+        if "format" in document:
+            if document["format"] != FORMAT or document.get("version") != VERSION:
+                result.error(number, "Неподдерживаемый формат")
+                break
+            continue
+        try:
+            data = validator.run_validation(document)
+        except ValidationError as error:
+            result.error(number, error.detail)
+            continue
+        author_data = document.get("author")
+        batch.append((number, author_data if isinstance(author_data, dict) else {}, data))
+        if len(batch) >= batch_size:
+            _import_batch(batch, author, create_authors, result)
+            batch = []
+    if batch:
+        _import_batch(batch, author, create_authors, result)
+    if result.exams:
+        catalogue.invalidate_on_commit()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def _get_authors(documents, create_authors):
+    emails = {document.get("email") for document in documents if document.get("email")}
+    authors = {user.email: user for user in CustomUser.objects.filter(email__in=emails)}
+    if create_authors:
+        for document in documents:
+            email = document.get("email")
+            if not email or email in authors:
+                continue
+            user = CustomUser.objects.create_user(email, None, is_teacher=True,
+                                                  first_name=document.get("first_name") or "",
+                                                  last_name=document.get("last_name") or "")
+            avatar = document.get("avatar")
+            if avatar and default_storage.exists(avatar):
+                user.profile.avatar.name = avatar
+                user.profile.save(update_fields=["avatar"])
+            authors[email] = user
+    return authors
+
+
+def _import_batch(batch, author, create_authors, result):
+    with transaction.atomic():
+        authors = {} if author else _get_authors([document for _, document, _ in batch], create_authors)
+        exams = []
+        exam_tasks = []
+        for number, document, data in batch:
+            exam_author = author or authors.get(document.get("email"))
+            if exam_author is None:
+                result.error(number, "Автор {} не найден".format(document.get("email")))
+                continue
+            tasks = data.pop("tasks")
+            exams.append(Exam(author=exam_author, task_count=len(tasks),
+                              max_scores=sum(task["scores"] for task in tasks), **data))
+            exam_tasks.append(tasks)
+        bulk.bulk_insert(Exam, exams)
+        created = bulk.create_tasks(zip(exams, exam_tasks))
+        search.index_exams([exam.pk for exam in exams])
+    result.exams += len(exams)
+    result.tasks += len(created)
@@ -6,6 +6,7 @@ from django.urls import path, include
 urlpatterns = [
     url(r'^auth/', include('djoser.urls')),
     url(r'^auth/', include('djoser.urls.authtoken')),
+    url(r'^auth/', include('djoser.urls.jwt')),
 ]
 
 router = DefaultRouter()
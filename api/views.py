@@ -1,27 +1,80 @@
+from django.db.models import Count, Max, Prefetch, prefetch_related_objects
 from rest_framework import viewsets
-from .models import Exam, Statistics, Profile, Comment, Task, Answer
-from rest_framework import mixins
-from .permissions import IsTeacherUser
-from . import serializers
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+from .models import Exam, Statistics, Profile, Comment, Task, Answer, ErrorStatistics
+from rest_framework import mixins, status
+from rest_framework.permissions import IsAuthenticated
+from .permissions import IsExamAuthor, IsTeacherUser
+from .mixins import CachedListMixin, ConditionalListMixin, ConditionalRetrieveMixin, TimedSerializerMixin
+from .pagination import ExamCursorPagination, StatisticsCursorPagination
+from .parsers import GzipParser, NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .throttling import SubmitRateThrottle
+from . import analytics, cache, catalogue, export, grading, metrics, search, serializers, transfer
 
 
-class ProfileViewSet(viewsets.GenericViewSet,
+class ProfileViewSet(TimedSerializerMixin,
+                     viewsets.GenericViewSet,
                      mixins.UpdateModelMixin):
     serializer_class = serializers.ProfileSerializer
     queryset = Profile.objects.all()
 
 
-class ExamViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Exam.objects.filter(is_show=True)
+class ExamViewSet(TimedSerializerMixin,
+                  ConditionalListMixin,
+                  CachedListMixin,
+                  ConditionalRetrieveMixin,
+                  viewsets.ReadOnlyModelViewSet):
+    queryset = Exam.objects.filter(is_show=True).select_related("author__profile")
+    pagination_class = ExamCursorPagination
+    cache_namespace = catalogue.NAMESPACE
 
     def get_serializer_class(self):
-        if self.action == "list":
+        if self.action in ("list", "search"):
             return serializers.ExamListSerializer
         else:
             return serializers.ExamRetrieveSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "list":
+            filters = serializers.ExamFilterSerializer(data=self.request.query_params)
+            filters.is_valid(raise_exception=True)
+            queryset = filters.filter_queryset(queryset)
+        if self.action == "retrieve":
+            comments = Comment.objects.select_related("author__profile")
+            queryset = queryset.prefetch_related(Prefetch("comments", queryset=comments))
+        return queryset
 
-class ExamWithTaskViewSet(viewsets.GenericViewSet,
+    def get_conditional_state(self, queryset):
+        if self.action == "retrieve":
+            state = queryset.aggregate(edit_time=Max("edit_time"),
+                                       comment_time=Max("comments__edit_time"),
+                                       comments=Count("comments"))
+            if not state["edit_time"]:
+                return None
+            # имена и аватарки автора и комментаторов меняют версию каталога
+            state["catalogue"] = cache.get_version(catalogue.NAMESPACE)
+            return state
+        # Версия кэша каталога меняется при любом видимом в списке изменении
+        return {"catalogue": cache.get_version(catalogue.NAMESPACE)}
+
+    @action(detail=False)
+    def search(self, request):
+        params = serializers.ExamSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        exam_ids = search.search(params.validated_data["q"], limit=params.validated_data["limit"])
+        exams = self.get_queryset().in_bulk(exam_ids)
+        serializer = self.get_serializer([exams[pk] for pk in exam_ids if pk in exams], many=True)
+        return Response({"results": serializer.data})
+
+
+class ExamWithTaskViewSet(TimedSerializerMixin,
+                          ConditionalRetrieveMixin,
+                          viewsets.GenericViewSet,
                           mixins.RetrieveModelMixin,
                           mixins.CreateModelMixin,
                           mixins.UpdateModelMixin,
@@ -31,12 +84,43 @@ class ExamWithTaskViewSet(viewsets.GenericViewSet,
 
     def get_queryset(self):
         if self.action == "retrieve":
-            return Exam.objects.all()
+            return Exam.objects.prefetch_related("tasks__answers")
         else:
             return Exam.objects.all()
 
+    def perform_destroy(self, instance):
+        # Ошибки удаляются вместе с попытками, удаляем их сразу, чтобы каскад
+        # не обнулял в них task и answer пачками по количеству строк
+        ErrorStatistics.objects.filter(statistics__exam=instance).delete()
+        instance.delete()
 
-class CommentViewSet(viewsets.GenericViewSet,
+    @action(detail=False, renderer_classes=[NDJSONRenderer])
+    def export(self, request):
+        """Контрольные текущего учителя в формате api.transfer, ?compress=gzip - сжатые"""
+        lines = transfer.export_exams(Exam.objects.filter(author=request.user))
+        if request.query_params.get("compress") == "gzip":
+            response = StreamingHttpResponse(transfer.gzip_chunks(lines), content_type="application/gzip")
+            response["Content-Disposition"] = 'attachment; filename="exams.ndjson.gz"'
+        else:
+            response = StreamingHttpResponse((line.encode() for line in lines), content_type="application/x-ndjson")
+            response["Content-Disposition"] = 'attachment; filename="exams.ndjson"'
+        return response
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[NDJSONParser, GzipParser])
+    def import_exams(self, request):
+        """Загружает контрольные из NDJSON или gzip от имени текущего учителя"""
+        if not hasattr(request.data, "read"):
+            raise ParseError("Ожидается тело application/x-ndjson или application/gzip")
+        result = transfer.import_exams(request.data, author=request.user)
+        if result.limit_exceeded:
+            code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        else:
+            code = status.HTTP_201_CREATED if result.exams else status.HTTP_200_OK
+        return Response(result.as_dict(), status=code)
+
+
+class CommentViewSet(TimedSerializerMixin,
+                     viewsets.GenericViewSet,
                      mixins.CreateModelMixin,
                      mixins.UpdateModelMixin,
                      mixins.DestroyModelMixin):
@@ -46,48 +130,158 @@ class CommentViewSet(viewsets.GenericViewSet,
         return Comment.objects.filter(author=self.request.user)
 
 
-class StatisticsViewSet(viewsets.GenericViewSet,
+class StatisticsViewSet(TimedSerializerMixin,
+                        viewsets.GenericViewSet,
                         mixins.ListModelMixin,
                         mixins.CreateModelMixin,
                         mixins.UpdateModelMixin):
+    pagination_class = StatisticsCursorPagination
+
     def get_serializer_class(self):
         if self.action in ["list", "retrieve"]:
             return serializers.StatisticsReadSerializer
         elif self.action == "update":
             return serializers.StatisticsPutSerializer
+        elif self.action == "submit":
+            return serializers.StatisticsSubmitSerializer
+        elif self.action == "summary":
+            return serializers.StudentSummarySerializer
         return serializers.StatisticsPostSerializer
 
     def get_queryset(self):
-        return Statistics.objects.filter(user=self.request.user)
+        queryset = Statistics.objects.filter(user=self.request.user).select_related("exam")
+        if self.action == "submit":
+            return queryset
+        return queryset.prefetch_related(self.get_errors_prefetch())
+
+    def get_errors_prefetch(self):
+        return Prefetch("errors", queryset=ErrorStatistics.objects.select_related("task"))
+
+    @action(detail=True, methods=["post"], throttle_classes=[SubmitRateThrottle])
+    def submit(self, request, pk=None):
+        statistics = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            grading.submit(statistics, serializer.get_selections())
+        except grading.AlreadyGraded:
+            return Response({"detail": "Попытка уже оценена"}, status=status.HTTP_409_CONFLICT)
+        prefetch_related_objects([statistics], self.get_errors_prefetch())
+        return Response(serializers.StatisticsReadSerializer(statistics, context=self.get_serializer_context()).data)
 
+    @action(detail=False)
+    def summary(self, request):
+        user = request.user
+        serializer = self.get_serializer({
+            "subjects": user.subject_summaries.order_by("subject"),
+            "exams": user.exam_summaries.select_related("exam").order_by("-last_time"),
+        })
+        return Response(serializer.data)
 
-class TaskViewSet(viewsets.GenericViewSet,
+
+class TaskViewSet(TimedSerializerMixin,
+                  viewsets.GenericViewSet,
                   mixins.DestroyModelMixin):
     permission_classes = [IsTeacherUser, ]
     serializer_class = serializers.TaskWithoutAnswersSerializer
 
     def get_queryset(self):
-        return Task.objects.filter(exam__author=self.request.user)
+        return Task.objects.filter(exam__author=self.request.user).select_related("exam")
+
+    def perform_destroy(self, instance):
+        exam = instance.exam
+        Task.objects.filter(pk=instance.pk).keep_error_questions()
+        instance.delete()
+        exam.refresh_summary()
 
 
-class AnswerViewSet(viewsets.GenericViewSet,
+class AnswerViewSet(TimedSerializerMixin,
+                    viewsets.GenericViewSet,
                     mixins.DestroyModelMixin):
     permission_classes = [IsTeacherUser, ]
     serializer_class = serializers.AnswerWithTaskSerializer
 
     def get_queryset(self):
-        return Answer.objects.filter(task__exam__author=self.request.user)
+        return Answer.objects.filter(task__exam__author=self.request.user).select_related("task__exam")
 
+    def perform_destroy(self, instance):
+        task = instance.task
+        instance.delete()
+        if instance.is_correct:
+            task.refresh_correct_count()
+        task.exam.save(update_fields=["edit_time"])
 
-class ExamsMeViewSet(viewsets.GenericViewSet,
+
+class ExamsMeViewSet(TimedSerializerMixin,
+                     viewsets.GenericViewSet,
                      mixins.ListModelMixin):
     serializer_class = serializers.ExamListSerializer
+    pagination_class = ExamCursorPagination
 
     def get_queryset(self):
-        return Exam.objects.filter(author=self.request.user)
+        return Exam.objects.filter(author=self.request.user).select_related("author__profile")
 
 
-class ExamsStatisticsViewSet(viewsets.GenericViewSet,
+class ExamsStatisticsViewSet(TimedSerializerMixin,
+                             viewsets.GenericViewSet,
                              mixins.RetrieveModelMixin):
-    serializer_class = serializers.ExamStatisticsSerializer
     queryset = Exam.objects.all()
+    pagination_class = StatisticsCursorPagination
+
+    def get_serializer_class(self):
+        if self.action == "summary":
+            return serializers.ExamSummarySerializer
+        elif self.action == "hardest":
+            return serializers.QuestionErrorsSerializer
+        elif self.action == "attempts":
+            return serializers.ExamReadItemStatistics
+        return serializers.ExamStatisticsSerializer
+
+    def get_queryset(self):
+        if self.action == "retrieve":
+            return Exam.objects.prefetch_related(Prefetch("statistics", queryset=self.get_attempts()))
+        return super().get_queryset()
+
+    def get_attempts(self):
+        return Statistics.objects.select_related("user__profile").prefetch_related(
+            Prefetch("errors", queryset=ErrorStatistics.objects.select_related("task")))
+
+    @action(detail=True, permission_classes=[IsAuthenticated, IsExamAuthor])
+    def summary(self, request, pk=None):
+        exam = self.get_object()
+        return Response(self.get_serializer(analytics.exam_summary(exam)).data)
+
+    @action(detail=True, permission_classes=[IsAuthenticated, IsExamAuthor])
+    def hardest(self, request, pk=None):
+        exam = self.get_object()
+        params = serializers.HardestQuestionsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        questions = analytics.question_errors(exam, analytics.graded_attempts(exam).count(),
+                                              limit=params.validated_data["limit"])
+        return Response(self.get_serializer(questions, many=True).data)
+
+    @action(detail=True, renderer_classes=[CSVRenderer, NDJSONRenderer],
+            permission_classes=[IsAuthenticated, IsExamAuthor])
+    def export(self, request, pk=None):
+        exam = self.get_object()
+        rows = export.exam_results(exam)
+        if request.accepted_renderer.format == "ndjson":
+            response = StreamingHttpResponse(export.iter_ndjson(rows), content_type="application/x-ndjson")
+        else:
+            response = StreamingHttpResponse(export.iter_csv(rows), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="exam-{}-results.{}"'.format(
+            exam.pk, request.accepted_renderer.format)
+        return response
+
+    @action(detail=True, permission_classes=[IsAuthenticated, IsExamAuthor])
+    def attempts(self, request, pk=None):
+        exam = self.get_object()
+        page = self.paginate_queryset(self.get_attempts().filter(exam=exam))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+def metrics_view(request):
+    """Метрики этого процесса в формате Prometheus, доступ проверяет metrics.can_view"""
+    if not metrics.can_view(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -89,11 +91,37 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# CACHE_BACKEND: file - общий для всех воркеров кэш в файлах,
+# db - таблица в базе (нужен manage.py createcachetable), locmem - память процесса
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "file")
+
+CACHE_BACKENDS = {
+    "file": {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get("CACHE_LOCATION", os.path.join(BASE_DIR, "cache")),
+    },
+    "db": {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'api_cache',
+    },
+    "locmem": {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+CACHES = {
+    'default': dict(CACHE_BACKENDS[CACHE_BACKEND], TIMEOUT=300, KEY_PREFIX="api"),
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.BasicAuthentication',
+        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedBasicAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -102,6 +130,18 @@ REST_FRAMEWORK = {
 }
 
 
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'AUTH_HEADER_TYPES': ('Bearer', 'JWT'),
+}
+
+# Сколько секунд проверенные логин и пароль Basic-авторизации не хэшируются повторно
+BASIC_AUTH_CACHE_TIMEOUT = 60
+# Сколько секунд пользователь токена хранится в кэше, изменения пользователя и выход сбрасывают запись,
+# изменения через QuerySet.update видны только по истечении этого срока
+TOKEN_AUTH_CACHE_TIMEOUT = 60
+
 DJOSER = {
     'SERIALIZERS': {
         'current_user': 'api.serializers.UserMeSerializer',
@@ -109,6 +149,31 @@ DJOSER = {
 }
 
 AUTH_USER_MODEL = "api.CustomUser"
+
+# Количество контрольных, ключи ответов которых хранятся в памяти процесса
+ANSWER_KEY_CACHE_SIZE = 256
+# Сколько раз пользователь может отправить ответы (statistics/<id>/submit/), None - без ограничения
+EXAM_SUBMIT_RATE = "10/min"
+
+# Метрики запросов (api.metrics): Server-Timing и /metrics, пороги для поиска N+1
+API_METRICS = {
+    "ENABLED": True,
+    "SERVER_TIMING": True,
+    "MAX_QUERIES_PER_ITEM": 1,
+    "MIN_ITEMS": 5,
+    "MAX_QUERIES": 50,
+    # Токен для Prometheus (bearer_token), без него /metrics доступен только сотрудникам
+    "TOKEN": os.environ.get("API_METRICS_TOKEN"),
+}
+
+# Ограничения загрузки контрольных (api.transfer): длина строки и размер после распаковки gzip
+EXAM_IMPORT_MAX_LINE = 1024 * 1024
+EXAM_IMPORT_MAX_SIZE = 256 * 1024 * 1024
+
+# Индекс полнотекстового поиска: auto - FTS5, если таблица создана миграцией,
+# fts5 или table - принудительно (после смены нужно выполнить rebuild_search_index)
+EXAM_SEARCH_BACKEND = os.environ.get("EXAM_SEARCH_BACKEND", "auto")
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
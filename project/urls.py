@@ -4,6 +4,7 @@ from django.conf.urls import url
 from rest_framework_swagger.views import get_swagger_view
 from . import settings
 from django.conf.urls.static import static
+from api.views import metrics_view
 
 schema_view = get_swagger_view(title='Pastebin API')
 
@@ -11,6 +12,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('_nested_admin/', include('nested_admin.urls')),
     path("api/v1/", include("api.urls")),
+    path("metrics", metrics_view),
     url(r'^$', schema_view,)
 ]
 if settings.DEBUG: